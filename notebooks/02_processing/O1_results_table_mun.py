@@ -3,11 +3,15 @@
 # libraries ############################################################################################################
 import logging
 import pathlib
-import datetime
 import pandas as pd
 import geopandas as gpd
 import numpy as np
-from rasterstats import zonal_stats
+from zonal import load_zone_labels, zonal_stats_years
+from parallel import parse_workers
+from years import incremental_years, parse_new_year
+from catalog import RasterCatalog
+from instrument import start_run, stage
+from landcover import class_names, study_area_classes, available_classes
 
 # settings #############################################################################################################
 # set logging config
@@ -17,20 +21,12 @@ logging.basicConfig(level=logging.INFO,
                     # filename = 'tidy_data.log'
                     )
 
-# set time count
-start_time = datetime.datetime.now()
-logging.info("Starting process")
+# time, peak memory and io of every stage, logged and written to data/logs/<script>.jsonl
+run = start_run(__file__)
 
 
 
 # functions ############################################################################################################
-def get_files(patterns):
-    all_files = []
-    for pat in patterns:
-        all_files.extend(path_landcover_92_19.glob(pat))
-    return all_files
-
-
 
 
 # folder path ##########################################################################################################
@@ -51,34 +47,14 @@ path_study_area = path_data_inter / 'study_area/study_area.gpkg'
 # landcover
 path_landcover_92_19 = path_data_raw / 'LC_CCI_ESA_COL'
 # global variables #####################################################################################################
-file_format = '*.tif'
-pattern_data = ('*v2.0.7.crop*', '*v2.1.1*')
-pattern_qa = '*qualityflag*'
-pattern_reforest = '*reforest.tiff*'
-pattern_deforest = '*deforest.tiff*'
-pattern_mask = '*_reforest_masked_copped.tiff'
-
-
-files_all = path_landcover_92_19.glob(file_format)
-files_all_list = list(path_landcover_92_19.glob(file_format))
-
-files_data_list = get_files(pattern_data)
-files_data = (y for y in files_data_list)
-
-files_qa = path_data.glob(pattern_qa)
-files_qa_list = list(path_landcover_92_19.glob(pattern_qa))
+# rasters indexed by product, variant and year, metadata cached between runs
+catalog = RasterCatalog([path_landcover_92_19, path_data_inter / 'lc_change'], path_data_inter / 'raster_catalog.json')
 
-files_reforest_list = list((path_data_inter / 'lc_change').glob(pattern_reforest))
-files_reforest = (path_data_inter / 'lc_change').glob(pattern_reforest)
+# number of worker processes (--workers, 0 uses every core)
+workers = parse_workers()
 
-files_deforest_list = list((path_data_inter / 'lc_change').glob(pattern_deforest))
-files_deforest = (path_data_inter / 'lc_change').glob(pattern_deforest)
-
-files_mask_list = list((path_data_inter / 'lc_change').glob(pattern_mask))
-files_mask = (path_data_inter / 'lc_change').glob(pattern_mask)
-
-years = [str(i) for i in range(2004, 2020)]
-files_mask_list_sp = [s for s in files_mask_list if any(xs in str(s) for xs in years)]
+# year ingested incrementally (--new-year), the rows of its transition are appended to the existing table
+new_year = parse_new_year()
 
 # global variables #####################################################################################################
 '''
@@ -110,37 +86,22 @@ pattern_veg = '*veg*'
 study_area = gpd.read_file(path_study_area)
 
 
+# rasterize study area once onto the masked change grid
+rasters_mask = catalog.rasters('change', 'reforest_masked_copped')
+study_area_labels = load_zone_labels(path_study_area, next(iter(rasters_mask.values())), path_data_inter / 'zones')
+
 # calculate count of each base land cover for each polygon
-dict_lc = {}
-for year in range(1992, 2019):
-    # input Raster
-    pathlib_to_tif = [lc for lc in files_mask_list if str(f'change_{year}') in str(lc)]
-    stats = zonal_stats(str(path_study_area),
-                        str(pathlib_to_tif[0]),
-                        categorical=True,
-                        copy_properties=True,
-                        geojson_out=True)
-
-    # transform geojson to dataframe
-    df = pd.DataFrame(stats)
-    df2 = pd.json_normalize(df['properties'])
-    # add year
-    df2['year'] = year
-    # add data to list
-    dict_lc[year] = df2.copy()
-
-    logging.info(f"Done calculating base land cover count for {str(year)}")
-
-# concat all years to one dataframe
-df_lc = pd.concat(dict_lc.values(), ignore_index=True)
-del dict_lc
-
-# delete shrubland
-df_lc.drop(df_lc.columns[len(df_lc.columns)-2], axis=1, inplace=True)
-# replace na with 0
-df_lc[[10, 30, 40,120]] = df_lc[[10, 30, 40,120]].fillna(0)
+# change rasters are keyed by their old year, the new year adds the transition from the year before
+rasters_lc = incremental_years(rasters_mask, None if new_year is None else new_year - 1)
+with stage('zonal_stats', years=len(rasters_lc)):
+    df_lc = zonal_stats_years(rasters_lc, {'study_area': study_area_labels}, workers=workers)['study_area']
+
+# delete flooded shrubland, selected by its code as the class columns are sorted by code
+df_lc.drop(columns=[180], errors='ignore', inplace=True)
+# replace na with 0, classes that never occur count 0
+df_lc[[10, 30, 40, 120]] = df_lc.reindex(columns=[10, 30, 40, 120]).fillna(0)
 # delete years I am not interested in
-df_lc = df_lc[~df_lc.iloc[:, 8].between(1990, 2003, inclusive=False)]
+df_lc = df_lc[~df_lc['year'].between(1990, 2003, inclusive='neither')]
 
 # sum up total numbet of afforested cells
 df_lc['total_change_cells'] = (df_lc[10] + df_lc[30] + df_lc[40]+ df_lc[120])
@@ -150,19 +111,13 @@ df_lc['total_change_cells'] = (df_lc[10] + df_lc[30] + df_lc[40]+ df_lc[120])
 df_lc_lf_orig = pd.read_csv(path_data_output / "df_lc.csv")
 
 # sum up total count of cells
-df_lc_lf_orig['total_sa_orig'] = df_lc_lf_orig['crop'] + df_lc_lf_orig['herb'] + df_lc_lf_orig['mosaic_crop'] +\
-                                 df_lc_lf_orig['mosaic_natural'] + df_lc_lf_orig['tree'] + df_lc_lf_orig['shrubland'] +\
-                                 df_lc_lf_orig['grassland'] +\
-                                 df_lc_lf_orig['tree_flood_fresh'] + df_lc_lf_orig['tree_flood_saline'] + \
-                                 df_lc_lf_orig['shrub_flooded'] + df_lc_lf_orig['water'] + \
-                                 df_lc_lf_orig['unknown'] + df_lc_lf_orig['mosaic_tree'] + \
-                                 df_lc_lf_orig['mosaic_herb'] + df_lc_lf_orig['urban']
+df_lc_lf_orig['total_sa_orig'] = df_lc_lf_orig[list(class_names(study_area_classes, 'short').values())].sum(axis=1)
 
 # sum up total count of cells which are eligible for afforestation
-df_lc_lf_orig['total_available_orig'] = df_lc_lf_orig['crop'] + df_lc_lf_orig['herb'] + df_lc_lf_orig['mosaic_crop'] +\
-                                 df_lc_lf_orig['mosaic_natural'] + df_lc_lf_orig['shrubland']
+df_lc_lf_orig['total_available_orig'] = \
+    df_lc_lf_orig[list(class_names(available_classes, 'short').values())].sum(axis=1)
 
-df_lc_lf_orig = df_lc_lf_orig[~df_lc_lf_orig.iloc[:, 23].between(1990, 2003, inclusive=False)]
+df_lc_lf_orig = df_lc_lf_orig[~df_lc_lf_orig['year'].between(1990, 2003, inclusive='neither')]
 
 # merge two dataframes
 df_lc_lf_orig['MPIO_CCDGO']=df_lc_lf_orig['MPIO_CCDGO'].astype(int)
@@ -177,4 +132,13 @@ df['change_hectar'] = df['total_change_cells'] * 9
 df['change_tot_per'] = df['total_change_cells'] / df['total_sa_orig']
 df['change_available_per'] = df['total_change_cells'] / df['total_available_orig']
 
+# extend the table of every transition with the new one instead of rebuilding it
+if new_year is not None:
+    df.columns = df.columns.map(str)
+    df_before = pd.read_csv(path_data_output / "O1_results_table_mun.csv", index_col=0)
+    df = pd.concat([df_before[df_before['year'] != new_year - 1], df], ignore_index=True)
+
 df.to_csv(path_data_output /"O1_results_table_mun.csv")
+
+# end time-count and print time stats ##################################################################################
+run.finish()
@@ -3,11 +3,15 @@
 # libraries ############################################################################################################
 import logging
 import pathlib
-import datetime
 import pandas as pd
 import geopandas as gpd
 import numpy as np
-from rasterstats import zonal_stats
+from zonal import load_zone_labels, zonal_stats_years
+from parallel import parse_workers
+from years import incremental_years, parse_new_year
+from catalog import RasterCatalog
+from instrument import start_run, stage
+from landcover import composition, study_area_classes
 
 # settings #############################################################################################################
 # set logging config
@@ -17,20 +21,12 @@ logging.basicConfig(level=logging.INFO,
                     # filename = 'tidy_data.log'
                     )
 
-# set time count
-start_time = datetime.datetime.now()
-logging.info("Starting process")
+# time, peak memory and io of every stage, logged and written to data/logs/<script>.jsonl
+run = start_run(__file__)
 
 
 
 # functions ############################################################################################################
-def get_files(patterns):
-    all_files = []
-    for pat in patterns:
-        all_files.extend(path_landcover_92_19.glob(pat))
-    return all_files
-
-
 
 
 # folder path ##########################################################################################################
@@ -51,33 +47,14 @@ path_study_area = path_data_inter / 'study_area/study_area.gpkg'
 # landcover
 path_landcover_92_19 = path_data_raw / 'LC_CCI_ESA_COL'
 # global variables #####################################################################################################
-file_format = '*.tif'
-pattern_data = ('*v2.0.7.crop*', '*v2.1.1*')
-pattern_qa = '*qualityflag*'
-pattern_reforest = '*reforest.tiff*'
-pattern_deforest = '*deforest.tiff*'
-pattern_mask = '*masked_cropped.tiff'
-
-files_all = path_landcover_92_19.glob(file_format)
-files_all_list = list(path_landcover_92_19.glob(file_format))
-
-files_data_list = get_files(pattern_data)
-files_data = (y for y in files_data_list)
-
-files_qa = path_data.glob(pattern_qa)
-files_qa_list = list(path_landcover_92_19.glob(pattern_qa))
-
-files_reforest_list = list((path_data_inter / 'lc_change').glob(pattern_reforest))
-files_reforest = (path_data_inter / 'lc_change').glob(pattern_reforest)
+# rasters indexed by product, variant and year, metadata cached between runs
+catalog = RasterCatalog([path_landcover_92_19, path_data_inter / 'lc_change'], path_data_inter / 'raster_catalog.json')
 
-files_deforest_list = list((path_data_inter / 'lc_change').glob(pattern_deforest))
-files_deforest = (path_data_inter / 'lc_change').glob(pattern_deforest)
+# number of worker processes (--workers, 0 uses every core)
+workers = parse_workers()
 
-files_mask_list = list((path_data_inter / 'lc_change').glob(pattern_mask))
-files_mask = (path_data_inter / 'lc_change').glob(pattern_mask)
-
-years = [str(i) for i in range(2004, 2020)]
-files_mask_list_sp = [s for s in files_mask_list if any(xs in str(s) for xs in years)]
+# year ingested incrementally (--new-year), its rows are appended to the existing table
+new_year = parse_new_year()
 
 # global variables #####################################################################################################
 '''
@@ -109,63 +86,27 @@ pattern_veg = '*veg*'
 dam_catch = gpd.read_file(path_study_area)
 dam_catch.to_crs(epsg=3116, inplace=True)
 
+# rasterize study area once onto the masked land cover grid
+rasters_mask = catalog.rasters('lc', 'masked_cropped')
+study_area_labels = load_zone_labels(path_study_area, next(iter(rasters_mask.values())), path_data_inter / 'zones')
+
 # calculate count of each base land cover for each polygon
-dict_lc = {}
-for year in range(1992, 2020):
-    # input Raster
-    pathlib_to_tif = [lc for lc in files_mask_list if str(year) in str(lc)]
-    stats = zonal_stats(str(path_study_area),
-                        str(pathlib_to_tif[0]),
-                        categorical=True,
-                        copy_properties=True,
-                        geojson_out=True)
-
-    # transform geojson to dataframe
-    df = pd.DataFrame(stats)
-    df2 = pd.json_normalize(df['properties'])
-    # add year
-    df2['year'] = year
-    # add data to list
-    dict_lc[year] = df2.copy()
-
-    logging.info(f"Done calculating base land cover count for {str(year)}")
-
-# concat all years to one dataframe
-df_lc = pd.concat(dict_lc.values(), ignore_index=True)
-del dict_lc
-# replace na wit 0
-df_lc[[10, 11, 30, 40, 50,120, 160, 170, 180, 210, 0, 100, 110, 130, 190]] = df_lc[[10, 11, 30, 40, 50,120, 160, 170, 180, 210, 0, 100, 110, 130, 190]].fillna(0)
-# calculte percentage of base land cover types
-df_lc["crop_share"] = df_lc[10] / (df_lc[10] + df_lc[11] + df_lc[30] + df_lc[40] + df_lc[50] + df_lc[120] + df_lc[160]+ df_lc[170] + df_lc[180] + df_lc[210] + df_lc[0] + df_lc[100] + df_lc[110] + df_lc[130]+ df_lc[190])
-df_lc["herb_share"] = df_lc[11] / (df_lc[10] + df_lc[11] + df_lc[30] + df_lc[40] + df_lc[50] + df_lc[120] + df_lc[160]+ df_lc[170] + df_lc[180] + df_lc[210] + df_lc[0] + df_lc[100] + df_lc[110] + df_lc[130]+ df_lc[190])
-df_lc["mosaic_crop_share"] = df_lc[30] / (df_lc[10] + df_lc[11] + df_lc[30] + df_lc[40] + df_lc[50] + df_lc[120] + df_lc[160]+ df_lc[170] + df_lc[180] + df_lc[210] + df_lc[0] + df_lc[100] + df_lc[110] + df_lc[130]+ df_lc[190])
-df_lc["mosaic_natural_share"] = df_lc[40] / (df_lc[10] + df_lc[11] + df_lc[30] + df_lc[40] + df_lc[50] + df_lc[120] + df_lc[160]+ df_lc[170] + df_lc[180] + df_lc[210] + df_lc[0] + df_lc[100] + df_lc[110] + df_lc[130]+ df_lc[190])
-df_lc["tree_share"] = df_lc[50] / (df_lc[10] + df_lc[11] + df_lc[30] + df_lc[40] + df_lc[50] + df_lc[120] + df_lc[160]+ df_lc[170] + df_lc[180] + df_lc[210] + df_lc[0] + df_lc[100] + df_lc[110] + df_lc[130]+ df_lc[190])
-df_lc["shrubland_share"] = df_lc[120] / (df_lc[10] + df_lc[11] + df_lc[30] + df_lc[40] + df_lc[50] + df_lc[120] + df_lc[160]+ df_lc[170] + df_lc[180] + df_lc[210] + df_lc[0] + df_lc[100] + df_lc[110] + df_lc[130]+ df_lc[190])
-df_lc["tree_flood_fresh_share"] = df_lc[160] / (df_lc[10] + df_lc[11] + df_lc[30] + df_lc[40] + df_lc[50] + df_lc[120] + df_lc[160]+ df_lc[170] + df_lc[180] + df_lc[210] + df_lc[0] + df_lc[100] + df_lc[110] + df_lc[130]+ df_lc[190])
-df_lc["tree_flood_saline_share"] = df_lc[170] / (df_lc[10] + df_lc[11] + df_lc[30] + df_lc[40] + df_lc[50] + df_lc[120] + df_lc[160]+ df_lc[170] + df_lc[180] + df_lc[210] + df_lc[0] + df_lc[100] + df_lc[110] + df_lc[130]+ df_lc[190])
-df_lc["shrub_flooded_share"] = df_lc[180] / (df_lc[10] + df_lc[11] + df_lc[30] + df_lc[40] + df_lc[50] + df_lc[120] + df_lc[160]+ df_lc[170] + df_lc[180] + df_lc[210] + df_lc[0] + df_lc[100] + df_lc[110] + df_lc[130]+ df_lc[190])
-df_lc["water_share"] = df_lc[210] / (df_lc[10] + df_lc[11] + df_lc[30] + df_lc[40] + df_lc[50] + df_lc[120] + df_lc[160]+ df_lc[170] + df_lc[180] + df_lc[210] + df_lc[0] + df_lc[100] + df_lc[110] + df_lc[130]+ df_lc[190])
-df_lc["outside_share"] = df_lc[0] / (df_lc[10] + df_lc[11] + df_lc[30] + df_lc[40] + df_lc[50] + df_lc[120] + df_lc[160]+ df_lc[170] + df_lc[180] + df_lc[210] + df_lc[0] + df_lc[100] + df_lc[110] + df_lc[130]+ df_lc[190])
-df_lc["mosaic_tree_share"] = df_lc[100] / (df_lc[10] + df_lc[11] + df_lc[30] + df_lc[40] + df_lc[50] + df_lc[120] + df_lc[160]+ df_lc[170] + df_lc[180] + df_lc[210] + df_lc[0] + df_lc[100] + df_lc[110] + df_lc[130]+ df_lc[190])
-df_lc["mosaic_herb_share"] = df_lc[110] /(df_lc[10] + df_lc[11] + df_lc[30] + df_lc[40] + df_lc[50] + df_lc[120] + df_lc[160]+ df_lc[170] + df_lc[180] + df_lc[210] + df_lc[0] + df_lc[100] + df_lc[110] + df_lc[130]+ df_lc[190])
-df_lc["grassland_share"] = df_lc[130] / (df_lc[10] + df_lc[11] + df_lc[30] + df_lc[40] + df_lc[50] + df_lc[120] + df_lc[160]+ df_lc[170] + df_lc[180] + df_lc[210] + df_lc[0] + df_lc[100] + df_lc[110] + df_lc[130]+ df_lc[190])
-df_lc["urban_share"] = df_lc[190] / (df_lc[10] + df_lc[11] + df_lc[30] + df_lc[40] + df_lc[50] + df_lc[120] + df_lc[160]+ df_lc[170] + df_lc[180] + df_lc[210] + df_lc[0] + df_lc[100] + df_lc[110] + df_lc[130]+ df_lc[190])
-
-df_lc.rename(columns={10: 'crop',
-                      11: 'herb',
-                      30: 'mosaic_crop',
-                      40: 'mosaic_natural',
-                      50: 'tree',
-                      120: 'shrubland',
-                      160: 'tree_flood_fresh',
-                      170: 'tree_flood_saline',
-                      180: 'shrub_flooded',
-                      210: 'water',
-                      0: 'unknown',
-                      100: 'mosaic_tree',
-                      110: 'mosaic_herb',
-                      130: 'grassland',
-                      190: 'urban'}, inplace=True)
+rasters_lc = incremental_years(rasters_mask, new_year)
+with stage('zonal_stats', years=len(rasters_lc)):
+    df_lc = zonal_stats_years(rasters_lc, {'study_area': study_area_labels}, workers=workers)['study_area']
+
+# class counts (classes missing from every counted year count 0) and share of every base land cover type
+df_lc = composition(df_lc, study_area_classes, names='short')
+# the share of class 0 keeps the name of the existing tables
+df_lc.rename(columns={'unknown_share': 'outside_share'}, inplace=True)
+
+# extend the table of every year with the new year instead of rebuilding it
+if new_year is not None:
+    df_lc.columns = df_lc.columns.map(str)
+    df_lc_before = pd.read_csv(path_data_output / "df_lc.csv", index_col=0)
+    df_lc = pd.concat([df_lc_before[df_lc_before['year'] != new_year], df_lc], ignore_index=True)
 
 df_lc.to_csv(path_data_output /"df_lc.csv")
+
+# end time-count and print time stats ##################################################################################
+run.finish()
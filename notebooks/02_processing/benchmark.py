@@ -0,0 +1,266 @@
+# !/usr/bin/env python3
+
+# libraries ############################################################################################################
+import gc
+import json
+import logging
+import pathlib
+import argparse
+import platform
+import tempfile
+import subprocess
+import numpy as np
+import pandas as pd
+import rasterio
+from change import change_detection, deforestation, reforestation
+from blocks import iter_blocks, window_where
+from masking import masked_views
+from zonal import rasterize_zones, zonal_stats_years
+from samples import build_samples, label_afforestation
+from predictors import PredictorStack
+from distance import nearest_feature, previous_year_events
+from neighbourhood import neighbourhood_counts
+from parallel import parse_workers, year_rng
+from synthetic import synthetic_landcover, synthetic_predictor, synthetic_zones, synthetic_lines, write_synthetic, \
+    synthetic_transform
+from instrument import start_run, stage
+
+# settings #############################################################################################################
+# set logging config
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s %(levelname)-8s %(message)s',
+                    datefmt='%a, %d, %b, %Y, %H:%M:%S',
+                    # filename = 'tidy_data.log'
+                    )
+
+# time, peak memory and io of every stage, logged and written to data/logs/<script>.jsonl
+run = start_run(__file__)
+
+
+# functions ############################################################################################################
+# scales to run (--scales small medium ...)
+def parse_scales(default):
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--scales', nargs='+', choices=list(scales), default=default)
+    args, _ = parser.parse_known_args()
+    return args.scales
+
+
+# short commit of the code being benchmarked, None outside a git checkout
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# run one stage and record its wall time, throughput and peak memory
+# peak_rss_mb is the peak resident memory of the process during the stage, peak_mb the peak of python / numpy
+# allocations (tracemalloc) with --trace-memory only, which slows the stages down, so only runs with the same setting
+# are compared, memory of worker processes is not included
+def run_stage(scale, name, func, n_items, unit):
+    gc.collect()
+    with stage(name, scale=scale) as frame:
+        result = func()
+
+    record = {'run': run.run_id,
+              'commit': commit,
+              'scale': scale,
+              'size': scales[scale],
+              'years': len(years),
+              'workers': workers,
+              'traced': traced,
+              'stage': name,
+              'seconds': round(frame.seconds, 4),
+              'items': int(n_items),
+              'unit': unit,
+              'throughput': round(n_items / frame.seconds, 1) if frame.seconds > 0 else None,
+              'peak_mb': round(frame.peak_traced / 2 ** 20, 1) if traced else None,
+              'peak_rss_mb': round(frame.peak_rss / 2 ** 20, 1),
+              **frame.counters}
+    records.append(record)
+    logging.info(f"{scale} {name}: {record['throughput']:,.0f} {unit}/s")
+    return result
+
+
+# every year read through the plantation mask as the stages after mask_deforestation.py read it, the number of forest
+# pixels
+def read_masked(rasters, path_plantation):
+    forest = 0
+    for view in masked_views(rasters, path_plantation).values():
+        for window, (data,) in iter_blocks([view]):
+            forest += int(np.count_nonzero(data == 50))
+    return forest
+
+
+# every pixel of the sampled classes in one year, as sample_points.py draws them
+def year_samples(path, year):
+    inds_classes = {classy: [] for classy in classes}
+    for window, (data,) in iter_blocks([path]):
+        data[data == 11] = 10
+        for classy in classes:
+            inds_classes[classy].append(np.transpose(window_where(data == classy, window)))
+
+    rng = year_rng(year)
+    samples = []
+    for classy in classes:
+        inds = np.concatenate(inds_classes[classy])
+        samples.append(inds[rng.choice(inds.shape[0], inds.shape[0], replace=False), :])
+    return samples
+
+
+# sample points of every year with the complete-series and only-forest filters, plot ids and afforestation labels
+def sample_generation(rasters):
+    df = build_samples({year: year_samples(path, year) for year, path in rasters.items()}, classes,
+                       synthetic_transform(), crs='EPSG:4326')
+    df['count'] = df.groupby(['x', 'y'])['x'].transform('size')
+    df = df[df['count'] == len(rasters)]
+    forest = df['class'] == 50
+    df.loc[forest, 'count_forest'] = df[forest].groupby(['x', 'y'])['class'].transform('count')
+    df = df[df['count_forest'] != len(rasters)].copy()
+    df['plot_id'] = df.groupby(['x', 'y']).ngroup().add(1)
+    df.reset_index(drop=True, inplace=True)
+    df['afforestation'] = label_afforestation(df)
+    return df
+
+
+# distance to the nearest road and river line and to last year's afforestation, as in create_data.py
+def distance_features(points, roads, rivers):
+    points = points.to_crs(epsg=3116)
+    return {'dist_road': nearest_feature(points, roads.to_crs(epsg=3116))['distance'].values,
+            'dist_river': nearest_feature(points, rivers.to_crs(epsg=3116))['distance'].values,
+            'afforestation': previous_year_events(points, points['afforestation'] == 1, years=years[1:], radius=1000)}
+
+
+# queens neighbourhood class counts of the points of every year
+def neighbourhood_features(points, rasters):
+    columns = []
+    for year, path in rasters.items():
+        mask = (points['year'] == year).values
+        with rasterio.open(path) as src:
+            data = src.read(1)
+        data[data == 11] = 10
+        columns.append(neighbourhood_counts(data, points.loc[mask, 'x'], points.loc[mask, 'y'], classes))
+    return pd.concat(columns)
+
+
+# synthetic inputs of one scale and every stage timed on them
+def benchmark_scale(scale, folder):
+    size = scales[scale]
+    n_pixels = size * size
+    logging.info(f"Generating synthetic data for {scale} ({size} x {size} pixels, {len(years)} years)")
+
+    rasters = synthetic_landcover(folder, size, years, change_rate=change_rate, seed=0)
+    municipalities = synthetic_zones(size, n_municipalities, seed=1, name='MPIO_CNM_1')
+    catchments = synthetic_zones(size, n_catchments, seed=2, name='catchment')
+    roads = synthetic_lines(size, n_roads, seed=3)
+    rivers = synthetic_lines(size, n_rivers, n_vertices=200, seed=4)
+    predictors = {f'predictor_{i}': synthetic_predictor(folder / f'predictor_{i}.tiff', size, seed=10 + i)
+                  for i in range(n_predictors)}
+
+    # deforested plantations, 1000 in a few blocks of the grid
+    plantation = np.zeros((size, size), dtype=np.int16)
+    plantation[size // 4:size // 2, size // 4:size // 2] = 1000
+    path_plantation = write_synthetic(folder / 'plantation.tiff', plantation, synthetic_transform())
+
+    # raster stages
+    run_stage(scale, 'change_detection',
+              lambda: change_detection(rasters, {'deforest': deforestation, 'reforest': reforestation},
+                                       folder / 'landcover_change_{year_old}_{year_new}_{product}.tiff',
+                                       workers=workers),
+              n_pixels * (len(years) - 1), 'pixels')
+
+    run_stage(scale, 'masking',
+              lambda: read_masked(rasters, path_plantation),
+              n_pixels * len(years), 'pixels')
+
+    def zonal_stats():
+        with rasterio.open(rasters[years[0]]) as src:
+            zone_layers = {'municipalities': (municipalities, rasterize_zones(municipalities, src)),
+                           'catchments': (catchments, rasterize_zones(catchments, src))}
+        return zonal_stats_years(rasters, zone_layers, workers=workers)
+    run_stage(scale, 'zonal_stats', zonal_stats, n_pixels * len(years), 'pixels')
+
+    points = run_stage(scale, 'sample_generation', lambda: sample_generation(rasters), n_pixels * len(years),
+                       'pixels')
+
+    # point stages
+    stack = PredictorStack(predictors)
+    run_stage(scale, 'predictor_sampling', lambda: stack.sample(points.x_coords, points.y_coords), len(points),
+              'points')
+    run_stage(scale, 'distance_features', lambda: distance_features(points, roads, rivers), len(points), 'points')
+    run_stage(scale, 'neighbourhood_counts', lambda: neighbourhood_features(points, rasters), len(points), 'points')
+
+
+# change of every stage's throughput against the last earlier run of the same scale, years, workers and tracing
+# (results without the traced field were all traced)
+def compare_previous(records, previous):
+    for record in records:
+        key = (record['scale'], record['years'], record['workers'], record['traced'], record['stage'])
+        earlier = [r for r in previous
+                   if (r['scale'], r['years'], r['workers'], r.get('traced', True), r['stage']) == key]
+        if not earlier or not earlier[-1]['throughput'] or not record['throughput']:
+            continue
+        change = record['throughput'] / earlier[-1]['throughput'] - 1
+        logging.info(f"{record['scale']} {record['stage']}: throughput {change:+.0%} against run "
+                     f"{earlier[-1]['run']} ({earlier[-1]['commit']})")
+
+
+# folder path ##########################################################################################################
+path_current = pathlib.Path.cwd()
+path_src = path_current / 'src'
+path_notebooks = path_current / 'notebooks'
+path_data = path_current / 'data'
+path_data_raw = path_data / '01_raw'
+path_data_inter = path_data / '02_intermediate'
+path_data_output = path_data / '03_processed'
+
+# benchmark results, one json record per run, scale and stage
+path_results = path_data / 'benchmarks/benchmark_results.jsonl'
+
+# global variables #####################################################################################################
+# raster size (pixels per side) of every scale, the study area crop is about 300 x 300
+scales = {'small': 256, 'medium': 512, 'large': 1024, 'xlarge': 2048}
+
+# scales to run (--scales), the larger ones need several GB of memory for the sample table
+run_scales = parse_scales(['small', 'medium'])
+
+# synthetic years, share of pixels changing class per year and size of the vector layers
+years = list(range(2003, 2011))
+change_rate = 0.02
+n_municipalities = 3
+n_catchments = 40
+n_roads = 200
+n_rivers = 5
+n_predictors = 9
+
+classes = [10, 30, 40, 120, 50]
+
+# number of worker processes (--workers, 0 uses every core)
+workers = parse_workers()
+
+# whether allocations are traced (--trace-memory), traced runs are slower and only compared with each other
+traced = run.traced
+
+# commit of the benchmarked code, stored with the records of this run
+commit = git_commit()
+records = []
+
+# process ##############################################################################################################
+for scale in run_scales:
+    with tempfile.TemporaryDirectory(prefix=f'benchmark_{scale}_') as folder:
+        benchmark_scale(scale, pathlib.Path(folder))
+
+# exporting ############################################################################################################
+previous = [json.loads(line) for line in path_results.read_text().splitlines()] if path_results.exists() else []
+compare_previous(records, previous)
+
+path_results.parent.mkdir(parents=True, exist_ok=True)
+with open(path_results, 'a') as f:
+    for record in records:
+        f.write(json.dumps({**record, 'python': platform.python_version(), 'numpy': np.__version__}) + '\n')
+logging.info(f"Appended {len(records)} results to {path_results}")
+
+# end time-count and print time stats ##################################################################################
+run.finish()
@@ -0,0 +1,106 @@
+# !/usr/bin/env python3
+
+# libraries ############################################################################################################
+import math
+import contextlib
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+import instrument
+
+# global variables #####################################################################################################
+# bytes of raster data a stage may hold at once
+memory_budget = 256 * 2 ** 20
+
+# internal tile size of every raster written by the pipeline
+output_block_size = 256
+
+
+# functions ############################################################################################################
+# creation options of every raster written by the pipeline (same as make_raster)
+def raster_profile(src, dtype='int16', nodata=None):
+    profile = src.profile.copy()
+    profile.update({'driver': 'GTiff',
+                    'count': 1,
+                    'dtype': dtype,
+                    'nodata': nodata,
+                    'compress': 'deflate',
+                    'predictor': 2,
+                    'tiled': True,
+                    'blockxsize': output_block_size,
+                    'blockysize': output_block_size})
+    return profile
+
+
+# full-width strips aligned to the internal block height of the input and to the tiles of the outputs, as high as the
+# memory budget allows for n_arrays arrays of itemsize bytes per pixel, memory_budget=None gives one window over the
+# whole raster
+# a strip ending inside an output tile row leaves compressed tiles half written, GDAL flushes and rewrites them (and
+# the file grows) once the block cache runs full, e.g. with every year pair open in change.change_detection
+def strip_windows(src, n_arrays=1, itemsize=8, memory_budget=memory_budget):
+    if memory_budget is None:
+        yield Window(0, 0, src.width, src.height)
+        return
+
+    step = math.lcm(src.block_shapes[0][0], output_block_size)
+    bytes_per_row = src.width * itemsize * max(n_arrays, 1)
+    rows = max(step, (memory_budget // bytes_per_row) // step * step)
+
+    for row_off in range(0, src.height, rows):
+        yield Window(0, row_off, src.width, min(rows, src.height - row_off))
+
+
+# open a raster path, or a virtual raster with an open_dataset() method (e.g. masking.MaskedView) that returns a
+# dataset reading like a rasterio one
+def open_raster(source):
+    if hasattr(source, 'open_dataset'):
+        return source.open_dataset()
+    return rasterio.open(source)
+
+
+# all rasters must share one grid before they are streamed block by block
+def check_grid(srcs):
+    first = srcs[0]
+    for src in srcs[1:]:
+        if (src.width, src.height, src.transform, src.crs) != (first.width, first.height, first.transform, first.crs):
+            raise ValueError(f"{src.name} is not on the grid of {first.name}")
+
+
+# stream aligned input rasters block by block, func(window, *arrays) returns {name: array} for the outputs
+# inputs: list of paths (or virtual rasters), outputs: {name: path}, every output is written per block so peak memory
+# is one strip
+def stream_blocks(inputs, outputs, func, dtype='int16', n_arrays=None, memory_budget=memory_budget):
+    with contextlib.ExitStack() as stack:
+        srcs = [stack.enter_context(open_raster(path)) for path in inputs]
+        check_grid(srcs)
+
+        profile = raster_profile(srcs[0], dtype=dtype)
+        dsts = {name: stack.enter_context(rasterio.open(path, 'w', **profile)) for name, path in outputs.items()}
+
+        n_arrays = n_arrays or len(srcs) + len(dsts)
+        for window in strip_windows(srcs[0], n_arrays=n_arrays, memory_budget=memory_budget):
+            arrays = [src.read(1, window=window) for src in srcs]
+            instrument.count(bytes_read=sum(data.nbytes for data in arrays))
+            for name, data in func(window, *arrays).items():
+                data = data.astype(dtype, copy=False)
+                dsts[name].write(data, 1, window=window)
+                instrument.count(bytes_written=data.nbytes)
+
+
+# reduce aligned input rasters block by block without writing, func(window, *arrays) is called for every strip
+def iter_blocks(inputs, n_arrays=None, memory_budget=memory_budget):
+    with contextlib.ExitStack() as stack:
+        srcs = [stack.enter_context(open_raster(path)) for path in inputs]
+        check_grid(srcs)
+
+        n_arrays = n_arrays or len(srcs)
+        for window in strip_windows(srcs[0], n_arrays=n_arrays, memory_budget=memory_budget):
+            arrays = [src.read(1, window=window) for src in srcs]
+            instrument.count(bytes_read=sum(data.nbytes for data in arrays))
+            yield window, arrays
+
+
+# row / col of every pixel where condition holds, in full-raster coordinates
+def window_where(condition, window):
+    rows, cols = np.nonzero(condition)
+    return rows + window.row_off, cols + window.col_off
@@ -0,0 +1,55 @@
+# !/usr/bin/env python3
+
+# libraries ############################################################################################################
+import logging
+import pathlib
+from cube import build_cube
+from catalog import RasterCatalog
+from instrument import start_run, stage
+
+# settings #############################################################################################################
+# set logging config
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s %(levelname)-8s %(message)s',
+                    datefmt='%a, %d, %b, %Y, %H:%M:%S',
+                    # filename = 'tidy_data.log'
+                    )
+
+# time, peak memory and io of every stage, logged and written to data/logs/<script>.jsonl
+run = start_run(__file__)
+
+
+# functions ############################################################################################################
+# folder path ##########################################################################################################
+path_current = pathlib.Path.cwd()
+path_src = path_current / 'src'
+path_notebooks = path_current / 'notebooks'
+path_data = path_current / 'data'
+path_data_raw = path_data / '01_raw'
+path_data_inter = path_data / '02_intermediate'
+path_data_output = path_data / '03_processed'
+
+# landcover
+path_landcover_92_19 = path_data_raw / 'LC_CCI_ESA_COL'
+
+# cubes
+path_cube = path_data_inter / 'cube'
+
+# global variables #####################################################################################################
+# rasters indexed by product, variant and year, metadata cached between runs
+catalog = RasterCatalog([path_landcover_92_19, path_data_inter / 'lc_change'], path_data_inter / 'raster_catalog.json')
+
+# bytes of raster data held at once
+memory_budget = 256 * 2 ** 20
+
+# process ##############################################################################################################
+path_cube.mkdir(parents=True, exist_ok=True)
+
+# original land cover, read by main_lc.py for the transitions of every pair of years
+rasters_lc = catalog.rasters('lc', 'original')
+with stage('cube_lc', years=len(rasters_lc)):
+    build_cube(rasters_lc, path_cube / 'lc_92_19.zarr', memory_budget=memory_budget)
+
+# exporting ############################################################################################################
+# end time-count and print time stats ##################################################################################
+run.finish()
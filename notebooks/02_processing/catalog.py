@@ -0,0 +1,129 @@
+# !/usr/bin/env python3
+
+# libraries ############################################################################################################
+import os
+import re
+import json
+import logging
+import pathlib
+import rasterio
+
+# global variables #####################################################################################################
+# file name rules: (regex, product, variant), the regex gives the year and optionally the version and a variant
+# suffix, checked in order
+name_rules = [
+    # ESA CCI / C3S land cover maps and their quality flags, v2.0.7 (1992 - 2015) is used cropped to Colombia
+    # (.crop), v2.1.1 (2016 on) as downloaded
+    (re.compile(r'LC.*-P1Y-(?P<year>\d{4})-v(?P<version>\d+\.\d+\.\d+).*qualityflag'), 'lc', 'qualityflag'),
+    (re.compile(r'LC.*-P1Y-(?P<year>\d{4})-v(?P<version>2\.0\.\d+)\.crop'), 'lc', 'original'),
+    (re.compile(r'LC.*-P1Y-(?P<year>\d{4})-v(?P<version>2\.0\.\d+)'), 'lc', 'global'),
+    (re.compile(r'LC.*-P1Y-(?P<year>\d{4})-v(?P<version>\d+\.\d+\.\d+)'), 'lc', 'original'),
+    # transitions of the pipeline, keyed by their old year
+    (re.compile(r'^landcover_change_(?P<year>\d{4})_\d{4}_(?P<variant>\w+)\.tiff?$'), 'change', None),
+    # masked and cropped land cover of the pipeline
+    (re.compile(r'^lc_original_(?P<year>\d{4})_(?P<variant>masked\w*)\.tiff?$'), 'lc', None),
+]
+
+# raster file extensions that are catalogued
+raster_suffixes = ('.tif', '.tiff')
+
+
+# functions ############################################################################################################
+# (product, variant, version, year) of a raster file name, None for files outside the naming rules
+def parse_name(name):
+    for regex, product, variant in name_rules:
+        match = regex.search(name)
+        if match is not None:
+            groups = match.groupdict()
+            return (product, variant or groups['variant'], groups.get('version'), int(groups['year']))
+    return None
+
+
+# versions compare by their numbers (2.0.7 < 2.1.1), rasters without a version first
+def version_key(version):
+    return tuple(int(part) for part in version.split('.')) if version else ()
+
+
+# grid, crs, dtype, block size and nodata of a raster, what alignment checks and stream sizes need
+def raster_meta(path):
+    with rasterio.open(path) as src:
+        return {'width': src.width,
+                'height': src.height,
+                'transform': list(src.transform.to_gdal()),
+                'crs': src.crs.to_wkt() if src.crs else None,
+                'dtype': src.dtypes[0],
+                'block_shape': list(src.block_shapes[0]),
+                'nodata': src.nodata}
+
+
+# index of the yearly rasters in some folders by (product, variant, version, year), the metadata of every raster is
+# cached in a json file and only read again from a raster whose size or mtime changed
+class RasterCatalog:
+
+    def __init__(self, folders, path_cache):
+        self.folders = [pathlib.Path(folder) for folder in folders]
+        self.path_cache = pathlib.Path(path_cache)
+        self.entries = {}
+        self.scan()
+
+    # list the folders once, parse the names and refresh the metadata of new or changed files
+    def scan(self):
+        cached = json.loads(self.path_cache.read_text()) if self.path_cache.exists() else {}
+
+        entries, n_read = {}, 0
+        for folder in self.folders:
+            for path in sorted(folder.iterdir()) if folder.exists() else []:
+                key = parse_name(path.name)
+                if key is None or path.suffix.lower() not in raster_suffixes:
+                    continue
+
+                stat = path.stat()
+                entry = cached.get(str(path))
+                if entry is None or (entry['size'], entry['mtime_ns']) != (stat.st_size, stat.st_mtime_ns):
+                    entry = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, **raster_meta(path)}
+                    n_read += 1
+                entries[str(path)] = {**entry, 'key': list(key)}
+
+        # (product, variant) -> year -> version -> path
+        self.entries = entries
+        self.index = {}
+        for path, entry in entries.items():
+            product, variant, version, year = entry['key']
+            self.index.setdefault((product, variant), {}).setdefault(year, {})[version] = pathlib.Path(path)
+
+        # stages running at once may scan together, the cache is replaced in one step
+        self.path_cache.parent.mkdir(parents=True, exist_ok=True)
+        path_tmp = self.path_cache.with_name(f'{self.path_cache.name}.{os.getpid()}')
+        path_tmp.write_text(json.dumps(entries, indent=1, sort_keys=True))
+        os.replace(path_tmp, self.path_cache)
+        logging.info(f"Catalogued {len(entries)} rasters, read metadata of {n_read}")
+
+    # path of one raster, version=None takes the newest version of the year
+    def get(self, product, variant, year, version=None):
+        versions = self.index.get((product, variant), {}).get(year, {})
+        if version is None and versions:
+            version = max(versions, key=version_key)
+        if version not in versions:
+            raise KeyError(f"no {product} {variant} raster for {year}")
+        return versions[version]
+
+    # {year: path} of a product variant sorted by year, one path per year (the newest version unless one is given),
+    # optionally only the years from first to last
+    def rasters(self, product, variant, version=None, first=None, last=None):
+        years = self.index.get((product, variant), {})
+        return {year: self.get(product, variant, year, version) for year in sorted(years)
+                if (first is None or year >= first) and (last is None or year <= last)
+                and (version is None or version in years[year])}
+
+    # cached metadata of a catalogued raster
+    def meta(self, path):
+        return self.entries[str(path)]
+
+    # all rasters must share one grid, checked from the cache without opening them
+    def check_grid(self, paths):
+        paths = list(paths)
+        grid = ('width', 'height', 'transform', 'crs')
+        first = [self.meta(paths[0])[k] for k in grid]
+        for path in paths[1:]:
+            if [self.meta(path)[k] for k in grid] != first:
+                raise ValueError(f"{path} is not on the grid of {paths[0]}")
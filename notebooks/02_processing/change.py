@@ -0,0 +1,74 @@
+# !/usr/bin/env python3
+
+# libraries ############################################################################################################
+import logging
+import contextlib
+import numpy as np
+import rasterio
+import functools
+import blocks
+import instrument
+from parallel import run_parallel, year_runs
+
+# global variables #####################################################################################################
+forest_class = 50
+
+
+# functions ############################################################################################################
+# reclassify crop classes (11 -> 10) in place, keeps the dtype of the raster
+def reclassify(data):
+    data[data == 11] = 10
+    return data
+
+
+# new land cover class where forest was lost from one year to the next, 0 elsewhere
+def deforestation(old, new):
+    return np.where((old == forest_class) & (new != forest_class), new, 0)
+
+
+# previous land cover class where forest was gained from one year to the next, 0 elsewhere
+def reforestation(old, new):
+    return np.where((new == forest_class) & (old != forest_class), old, 0)
+
+
+# slide over consecutive years keeping only the previous year in memory, every raster is read once and every
+# product (e.g. {'deforest': deforestation}) is written from the same pair of arrays
+# the rasters are streamed in strips within the memory budget, so the years are walked once per strip
+# with several workers every worker slides over its own contiguous run of years, only the boundary years are read twice
+# rasters: {year: path}, out_pattern: file name with {year_old}, {year_new} and {product} fields
+def change_detection(rasters, products, out_pattern, memory_budget=blocks.memory_budget, workers=1):
+    years = sorted(rasters)
+    if workers > 1 and len(years) > 2:
+        run = functools.partial(change_detection, products=products, out_pattern=out_pattern,
+                                memory_budget=memory_budget, workers=1)
+        run_parallel(run, [{year: rasters[year] for year in run_years} for run_years in year_runs(years, workers)],
+                     workers=workers)
+        return
+
+    pairs = [(year, year + 1) for year in years if year + 1 in rasters]
+
+    with contextlib.ExitStack() as stack:
+        srcs = {year: stack.enter_context(blocks.open_raster(rasters[year])) for year in years}
+        blocks.check_grid(list(srcs.values()))
+
+        profile = blocks.raster_profile(srcs[years[0]], dtype='int16')
+        dsts = {(year_old, year_new, product): stack.enter_context(
+                    rasterio.open(str(out_pattern).format(year_old=year_old, year_new=year_new, product=product),
+                                  'w', **profile))
+                for year_old, year_new in pairs for product in products}
+
+        for window in blocks.strip_windows(srcs[years[0]], n_arrays=2 + len(products), itemsize=2,
+                                           memory_budget=memory_budget):
+            data_old, year_old = None, None
+            for year in years:
+                data_new = reclassify(srcs[year].read(1, window=window))
+                instrument.count(bytes_read=data_new.nbytes)
+                if (year_old, year) in pairs:
+                    for product, func in products.items():
+                        data = func(data_old, data_new).astype('int16')
+                        dsts[(year_old, year, product)].write(data, 1, window=window)
+                        instrument.count(bytes_written=data.nbytes)
+                data_old, year_old = data_new, year
+
+    for year_old, year_new in pairs:
+        logging.info(f"Done processing {', '.join(products)} from {str(year_old)} to {str(year_new)}")
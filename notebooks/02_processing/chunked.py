@@ -0,0 +1,187 @@
+# !/usr/bin/env python3
+
+# libraries ############################################################################################################
+import logging
+import argparse
+import threading
+import contextlib
+import multiprocessing
+import concurrent.futures
+import numpy as np
+import pandas as pd
+import rasterio
+import dask
+import dask.array as da
+from dask.base import tokenize
+from rasterio.windows import Window
+import blocks
+from masking import mask_plantation
+from zonal import zonal_counts, counts_table
+
+# global variables #####################################################################################################
+# spatial chunk size of the lazy arrays, a multiple of the 256 pixel blocks of the pipeline rasters
+chunk_size = 1024
+
+
+# functions ############################################################################################################
+# dask scheduler of the reductions (--scheduler threads / processes / synchronous)
+def parse_scheduler(default='threads'):
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--scheduler', choices=['threads', 'processes', 'synchronous'], default=default)
+    args, _ = parser.parse_known_args()
+    return args.scheduler
+
+
+# a raster (path or virtual raster, e.g. masking.MaskedView) as an array that reads only the window of a slice,
+# every slice opens the raster itself so chunks can be read by threads or by worker processes
+class RasterArray:
+
+    def __init__(self, source):
+        self.source = source
+        with blocks.open_raster(source) as src:
+            self.shape = (src.height, src.width)
+            self.dtype = np.dtype(src.dtypes[0])
+            self.nodata = src.nodata
+        self.ndim = 2
+
+    def __getitem__(self, key):
+        rows, cols = key
+        with blocks.open_raster(self.source) as src:
+            return src.read(1, window=Window.from_slices(rows, cols, height=self.shape[0], width=self.shape[1]))
+
+
+# lazy (dask) array of a raster, chunked in squares of chunk_size pixels
+def lazy_raster(source, chunks=chunk_size):
+    return da.from_array(RasterArray(source), chunks=chunks, lock=False, asarray=True, fancy=False,
+                         name=f'raster-{tokenize(str(source))}')
+
+
+# lazy arrays of yearly rasters: {year: path} -> {year: dask array}
+def lazy_rasters(rasters, chunks=chunk_size):
+    return {year: lazy_raster(path, chunks) for year, path in rasters.items()}
+
+
+# change.reclassify without modifying the read chunk, which other outputs may share
+def lazy_reclassify(data):
+    return da.where(data == 11, 10, data)
+
+
+# lazy change rasters of consecutive years as change.change_detection writes them, every chunk of a year is read once
+# for all pairs and products using it
+# arrays: {year: dask array}, products: {product: func(old, new)}, returns {(year_old, year_new, product): int16 array}
+def lazy_change(arrays, products):
+    years = sorted(arrays)
+    reclassified = {year: lazy_reclassify(arrays[year]) for year in years}
+    return {(year, year + 1, product): func(reclassified[year], reclassified[year + 1]).astype('int16')
+            for year in years if year + 1 in arrays for product, func in products.items()}
+
+
+# lazy land cover with the deforested plantation pixels set back to forest (masking.mask_plantation per chunk)
+def lazy_masked(arrays, plantation_mask):
+    return {year: da.map_blocks(mask_plantation, data, plantation_mask, dtype=data.dtype)
+            for year, data in arrays.items()}
+
+
+# lazy quality checks of re- / deforestation rasters, the outputs of esa_lc_qualitycheck.py (all int16): pixels with
+# any re- / deforestation, with both, the summed reforest classes and the number of events
+def lazy_quality_check(reforest, deforest):
+    reforest = da.stack(reforest)
+    deforest = da.stack(deforest)
+    n_reforest = (reforest != 0).sum(axis=0, dtype=np.uint8)
+    n_deforest = (deforest != 0).sum(axis=0, dtype=np.uint8)
+    any_reforest = (n_reforest > 0).astype(np.int16)
+    any_deforest = (n_deforest > 0).astype(np.int16)
+    return {'double_reforested': any_reforest,
+            'double_deforested': any_deforest,
+            'de_and_aff': any_reforest + any_deforest,
+            'reforested': reforest.sum(axis=0, dtype=np.int16),
+            'reforest_events': n_reforest.astype(np.int16),
+            'deforest_events': n_deforest.astype(np.int16)}
+
+
+# class counts of several chunks added up: [(classes, counts)] -> (classes, counts) as zonal.zonal_counts gives them
+def merge_counts(parts, n_zones):
+    classes = sorted(set().union(*[part_classes.tolist() for part_classes, _ in parts]))
+    position = {c: i for i, c in enumerate(classes)}
+    counts = np.zeros((n_zones, len(classes)), dtype=np.int64)
+    for part_classes, part_counts in parts:
+        counts[:, [position[c] for c in part_classes.tolist()]] += part_counts
+    return np.array(classes, dtype=np.int64), counts
+
+
+# lazy zonal.zonal_counts of one array: every chunk is counted with its own bincount, the chunk counts are added up
+# labels: zone labels (numpy) on the grid of data
+def lazy_zonal_counts(labels, data, n_zones, nodata=None):
+    labels = da.from_array(labels, chunks=data.chunks)
+    parts = [dask.delayed(zonal_counts)(label_block, data_block, n_zones, nodata)
+             for label_block, data_block in zip(labels.to_delayed().ravel(), data.to_delayed().ravel())]
+    return dask.delayed(merge_counts)(parts, n_zones)
+
+
+# zonal.zonal_stats_years on lazy arrays, every year and zone layer counted in one computation
+# arrays: {year: dask array}, zone_layers: {name: (zones, labels)}, nodata of the rasters
+# the process pool forks as parallel.run_parallel, the scripts have no __main__ guard and would be re-run by the
+# spawned workers of the default dask pool
+def lazy_zonal_stats(arrays, zone_layers, nodata=None, scheduler='threads', workers=None):
+    tasks = {name: [lazy_zonal_counts(labels, data, len(zones), nodata) for data in arrays.values()]
+             for name, (zones, labels) in zone_layers.items()}
+    if scheduler == 'processes':
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers,
+                                                    mp_context=multiprocessing.get_context('fork')) as pool:
+            (results,) = dask.compute(tasks, scheduler=scheduler, pool=pool)
+    else:
+        (results,) = dask.compute(tasks, scheduler=scheduler, num_workers=workers)
+    return {name: counts_table(zones, list(arrays), results[name]) for name, (zones, _) in zone_layers.items()}
+
+
+# target of da.store that writes every computed chunk into its window of an open raster
+class RasterWriter:
+
+    def __init__(self, dst):
+        self.dst = dst
+
+    def __setitem__(self, key, data):
+        rows, cols = key
+        self.dst.write(data, 1, window=Window.from_slices(rows, cols, height=self.dst.height, width=self.dst.width))
+
+
+# compute lazy arrays into GeoTIFFs with the pipeline profile of the template raster, in one computation so shared
+# chunks (e.g. a year used by two pairs) are read once
+# a GTiff can only be written from one process, so the chunks are computed and written by threads of this process
+# arrays: {name: dask array}, outputs: {name: path}
+def store_rasters(arrays, outputs, template, workers=None):
+    with contextlib.ExitStack() as stack:
+        with blocks.open_raster(template) as src:
+            profiles = {name: blocks.raster_profile(src, dtype=array.dtype.name) for name, array in arrays.items()}
+        dsts = {name: stack.enter_context(rasterio.open(outputs[name], 'w', **profiles[name])) for name in arrays}
+        da.store([arrays[name] for name in arrays], [RasterWriter(dsts[name]) for name in arrays],
+                 lock=threading.Lock(), scheduler='threads', num_workers=workers)
+    logging.info(f"Done writing {len(arrays)} rasters")
+
+
+# pixels that differ between two rasters, read block by block, None if the second one does not exist
+def compare_rasters(path, path_reference):
+    if not path_reference.exists():
+        return None
+    differ = 0
+    for _, (data, reference) in blocks.iter_blocks([path, path_reference]):
+        differ += int(np.count_nonzero(data != reference))
+    return differ
+
+
+# values that differ between a table and a csv written by the scripts, in the numeric columns both have (shares
+# compared with a float tolerance), rows in the same order (zones by year as zonal.counts_table gives them), missing
+# or extra rows count as differing in every column, None if the csv does not exist
+def compare_tables(df, path_reference):
+    if not path_reference.exists():
+        return None
+    reference = pd.read_csv(path_reference, index_col=0)
+    df = df.set_axis(df.columns.map(str), axis=1).reset_index(drop=True)
+    columns = [column for column in df.columns if column in reference.columns
+               and pd.api.types.is_numeric_dtype(df[column]) and pd.api.types.is_numeric_dtype(reference[column])]
+
+    n_rows = min(len(df), len(reference))
+    values = df[columns].to_numpy(dtype=np.float64)[:n_rows]
+    values_reference = reference[columns].to_numpy(dtype=np.float64)[:n_rows]
+    differ = np.count_nonzero(~np.isclose(values, values_reference, equal_nan=True))
+    return int(differ) + abs(len(df) - len(reference)) * len(columns)
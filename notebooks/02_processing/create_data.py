@@ -3,10 +3,15 @@
 # libraries ############################################################################################################
 import logging
 import pathlib
-import datetime
 import pandas as pd
 import geopandas as gpd
 import rasterio
+from distance import nearest_feature, previous_year_events
+from neighbourhood import neighbourhood_counts
+from predictors import PredictorStack
+from catalog import RasterCatalog
+from tables import read_dataset, write_dataset, write_plot_tables, compact_samples
+from instrument import start_run, stage, count
 
 # settings #############################################################################################################
 # set logging config
@@ -16,14 +21,14 @@ logging.basicConfig(level=logging.INFO,
                     # filename = 'tidy_data.log'
                     )
 
-# set time count
-start_time = datetime.datetime.now()
-logging.info("Starting process")
+# time, peak memory and io of every stage, logged and written to data/logs/<script>.jsonl
+run = start_run(__file__)
 
 
 # functions ############################################################################################################
-def min_distance(point, lines):
-    return lines.distance(point).min()
+def read_file(file):
+    with rasterio.open(file) as src:
+        return src.read(1)
 
 
 # folder path ##########################################################################################################
@@ -48,7 +53,7 @@ path_landcover_92_19 = path_data_raw / 'LC_CCI_ESA_COL'
 path_oferta_ambiental = path_data_raw / 'igac/ofertas_ambiental.gpkg'
 
 # points
-path_points = path_data_inter / 'sample_points/sample_points_v2.gpkg'
+path_points = path_data_inter / 'sample_points/sample_points_v2.parquet'
 
 # dem
 path_alt = path_data_inter /    'dem/srtm_22_11_resample.tif'
@@ -73,9 +78,25 @@ path_vias = path_data_inter / 'roads/vias_santander.gpkg'
 path_palm_oil = path_data_raw / 'palm_oil/Universal_Mill_List-shp/Universal_Mill_List.shp'
 
 # global variables #####################################################################################################
+# rasters indexed by product, variant and year, metadata cached between runs
+catalog = RasterCatalog([path_landcover_92_19, path_data_inter / 'lc_change'], path_data_inter / 'raster_catalog.json')
+
+# land cover classes and window size (pixels) of the queens neighbourhood
+neighbourhood_classes = [10, 30, 40, 50, 120]
+neighbourhood_size = 3
+
+# also write the GeoPackage and CSV copies (slow, for QGIS and spreadsheets)
+export_gpkg = False
+
+# also write the plot table (geometry and pixel once per plot) with the attributes per plot and year
+export_plot_tables = False
+
 # process ##############################################################################################################
 logging.info("Load points")
-points = gpd.read_file(path_points)
+with stage('load_points'):
+    points = read_dataset(path_points)
+    count(rows=len(points))
+sample_years = sorted(points['year'].unique().tolist())
 logging.info("Load study area")
 study_area = gpd.read_file(path_study_area)
 
@@ -97,57 +118,33 @@ points_buffer = gpd.clip(points, study_area_buffer)
 del points, study_area
 '''
 points_buffer = points
-# get altitude, slope, aspect and curvature info for each point
-logging.info("Get altitude, slope, aspect and curvature info per point")
+# get dem, soil and distance to populated center 2015 info for each point in one indexed read per raster
+logging.info("Get altitude, slope, aspect, curvature, soil and distance to populated center info per point")
 points_buffer.index = range(len(points_buffer))
-coords = [(x, y) for x, y in zip(points_buffer.x_coords, points_buffer.y_coords)]
-
-altitude = rasterio.open(path_alt)
-points_buffer['altitude'] = [x[0] for x in altitude.sample(coords)]
-del altitude
-
-slope = rasterio.open(path_slope)
-points_buffer['slope'] = [x[0] for x in slope.sample(coords)]
-del slope
-
-curv = rasterio.open(path_curv)
-points_buffer['curvature'] = [x[0] for x in curv.sample(coords)]
-del curv
-
-aspect = rasterio.open(path_aspect)
-points_buffer['aspect'] = [x[0] for x in aspect.sample(coords)]
-del aspect
-
-# get soil attributes info for each point
-logging.info("Get soil info per point")
-
-AWcTS = rasterio.open(path_awcts)
-points_buffer['AWcTS'] = [x[0] for x in AWcTS.sample(coords)]
-del AWcTS
-
-WWP = rasterio.open(path_wwp)
-points_buffer['WWP'] = [x[0] for x in WWP.sample(coords)]
-del WWP
-
-ORCDRC = rasterio.open(path_orcdrc)
-points_buffer['ORCDRC'] = [x[0] for x in ORCDRC.sample(coords)]
-del ORCDRC
-
-PHIHOX = rasterio.open(path_phinox)
-points_buffer['PHIHOX'] = [x[0] for x in PHIHOX.sample(coords)]
-del PHIHOX
-
-# get distance to populated center 2015 info for each point
-logging.info("Get distance to populated center 2015 per point")
-dist_pop = rasterio.open(path_dis_pop)
-points_buffer['dist_pop'] = [x[0] for x in dist_pop.sample(coords)]
-del dist_pop
+predictor_stack = PredictorStack({'altitude': path_alt,
+                                  'slope': path_slope,
+                                  'curvature': path_curv,
+                                  'aspect': path_aspect,
+                                  'AWcTS': path_awcts,
+                                  'WWP': path_wwp,
+                                  'ORCDRC': path_orcdrc,
+                                  'PHIHOX': path_phinox,
+                                  'dist_pop': path_dis_pop})
+with stage('predictors'):
+    predictor_values, predictor_nodata = predictor_stack.sample(points_buffer.x_coords, points_buffer.y_coords)
+    count(rows=len(predictor_values))
+for name in predictor_values.columns:
+    points_buffer[name] = predictor_values[name].values
+    logging.info(f"{name}: {predictor_nodata[name].sum()} points without data")
+del predictor_stack, predictor_values, predictor_nodata
 
 # get municpalties attributes info for each point
 logging.info("Get municpalties info per point")
 municipality = gpd.read_file(path_munic)
 municipality = municipality[['MPIO_CNM_1', 'geometry']]
-points_buffer = gpd.sjoin(points_buffer, municipality, op='within')
+with stage('join_municipality'):
+    points_buffer = gpd.sjoin(points_buffer, municipality, op='within')
+    count(features=len(municipality))
 del municipality
 
 # get oferta ambiental info for each point
@@ -156,18 +153,23 @@ oferta_ambiental = gpd.read_file(path_oferta_ambiental)
 oferta_ambiental = oferta_ambiental[['Oferta_Amb', 'geometry']]
 oferta_ambiental.to_crs(epsg=4326, inplace=True)
 del points_buffer['index_right']
-points_buffer = gpd.sjoin(points_buffer, oferta_ambiental, op='within')
+with stage('join_oferta_ambiental'):
+    points_buffer = gpd.sjoin(points_buffer, oferta_ambiental, op='within')
+    count(features=len(oferta_ambiental))
 del oferta_ambiental
 
+# municipality and oferta names as categories
+compact_samples(points_buffer)
+
 # get distance to river info for each point
 logging.info("Get distance to river per point")
 river = gpd.read_file(path_river)
 river.to_crs(epsg=3116, inplace=True)
 points_buffer.to_crs(epsg=3116, inplace=True)
-river.sindex
-points_buffer.sindex
 
-points_buffer['dist_river'] = points_buffer.geometry.apply(min_distance, args=(river,))
+with stage('dist_river'):
+    points_buffer['dist_river'] = nearest_feature(points_buffer, river)['distance'].values
+    count(features=len(river))
 del river
 
 # get distance to oil palm mill info for each point
@@ -176,7 +178,9 @@ palm_oil = gpd.read_file(path_palm_oil)
 palm_oil_SA = gpd.clip(palm_oil, study_area)
 palm_oil_SA.to_crs(epsg=3116, inplace=True)
 
-points_buffer['dist_po_mill'] = points_buffer.geometry.apply(min_distance, args=(palm_oil_SA,))
+with stage('dist_po_mill'):
+    points_buffer['dist_po_mill'] = nearest_feature(points_buffer, palm_oil_SA)['distance'].values
+    count(features=len(palm_oil_SA))
 del palm_oil, palm_oil_SA
 
 # get distance to closest osm street info for each point
@@ -185,7 +189,9 @@ osm_streets = gpd.read_file(path_roads)
 osm_streets_SA = gpd.clip(osm_streets, study_area)
 osm_streets_SA.to_crs(epsg=3116, inplace=True)
 
-points_buffer['dist_road_osm'] = points_buffer.geometry.apply(min_distance, args=(osm_streets_SA,))
+with stage('dist_road_osm'):
+    points_buffer['dist_road_osm'] = nearest_feature(points_buffer, osm_streets_SA)['distance'].values
+    count(features=len(osm_streets_SA))
 del osm_streets, osm_streets_SA
 
 # get distance to closest via info for each point
@@ -194,7 +200,9 @@ vias_streets = gpd.read_file(path_vias)
 vias_streets_SA = gpd.clip(vias_streets, study_area)
 vias_streets_SA.to_crs(epsg=3116, inplace=True)
 
-points_buffer['dist_road_vias'] = points_buffer.geometry.apply(min_distance, args=(vias_streets_SA,))
+with stage('dist_road_vias'):
+    points_buffer['dist_road_vias'] = nearest_feature(points_buffer, vias_streets_SA)['distance'].values
+    count(features=len(vias_streets_SA))
 del vias_streets, vias_streets_SA
 
 points_buffer['dist_road'] = points_buffer[['dist_road_osm','dist_road_vias']].min(axis=1)
@@ -202,63 +210,55 @@ points_buffer['dist_road'] = points_buffer[['dist_road_osm','dist_road_vias']].m
 
 # get distance to nearest afforested in previous year
 logging.info("Get distance to nearest afforested cell per point")
-for year in range(2004, 2020):
-    mask = (points_buffer['year'] == year)
-    points_buffer_valid = points_buffer[(points_buffer['year'] == year)]
-    past = points_buffer[(points_buffer['year'] == year - 1) & (points_buffer['afforestation'] == 1)]
-    points_buffer.loc[mask, 'dist_afforestation'] = points_buffer_valid.geometry.apply(min_distance, args=(past,))
-    logging.info(f"Get distance to afforestation for year {year}/{year - 1}")
+with stage('dist_afforestation'):
+    afforestation_past = previous_year_events(points_buffer, points_buffer['afforestation'] == 1,
+                                              years=sample_years[1:],
+                                              radius=1000)
+points_buffer['dist_afforestation'] = afforestation_past['distance'].values
+points_buffer['count_afforestation_1km'] = afforestation_past['count'].values
 
 # get landcover share infor per point
 logging.info("Get landcover share in queens neighbourhood")
-# Create a buffered polygon layer from your plot location points
-points_buffer_poly = points_buffer.copy()
-points_buffer_poly["geometry"] = points_buffer.geometry.buffer(450)
+# count neighbouring pixels per class with a moving window on each year's masked land cover
 del points_buffer['index_right']
-del points_buffer_poly['index_right']
-
-dn = []
-for year in range(2003, 2020):
-    # filter year
-    polys = points_buffer_poly[points_buffer_poly['year'] == year]
-    points = points_buffer[points_buffer['year'] == year]
-
-    # perform sjoin
-    poly_point = gpd.sjoin(polys, points[['geometry', 'class']], op='contains')
-
-    # data wrangling
-    poly_point_pivot = pd.pivot_table(poly_point, index=poly_point.index, columns='class_right',
-                                      aggfunc={'class_right': len})
-    poly_point_pivot.columns = poly_point_pivot.columns.droplevel()
-
-    result = polys.merge(poly_point_pivot, how='left', on=poly_point_pivot.index)
-    dn.append(result)
+points_buffer.reset_index(drop=True, inplace=True)
+neighbourhood_columns = [str(c) for c in neighbourhood_classes]
+for year in sample_years:
+    with stage('neighbourhood', year=year):
+        mask = (points_buffer['year'] == year).values
+        year_lc_data = read_file(catalog.get('lc', 'masked_cropped', year))
+        count(bytes_read=year_lc_data.nbytes, rows=mask.sum())
+
+        # reclassify crop classes
+        year_lc_data[year_lc_data == 11] = 10
+
+        # sample points store the pixel row in x and the pixel column in y
+        neigh = neighbourhood_counts(year_lc_data,
+                                     rows=points_buffer.loc[mask, 'x'],
+                                     cols=points_buffer.loc[mask, 'y'],
+                                     classes=neighbourhood_classes,
+                                     size=neighbourhood_size)
+        points_buffer.loc[mask, neighbourhood_columns] = neigh[neighbourhood_columns].values
     logging.info(f'Done getting neighbours for {year}')
 
-df = pd.concat(dn)
-df.reset_index(drop=True, inplace=True)
-df.loc[df['class'] == '10', '10'] = df['10'] - 1
-df.loc[df['class'] == '30', '30'] = df['30'] - 1
-df.loc[df['class'] == '40', '40'] = df['40'] - 1
-df.loc[df['class'] == '50', '50'] = df['50'] - 1
-df.loc[df['class'] == '120', '120'] = df['120'] - 1
-
-df['neigh_tot'] = df.iloc[:, -5:].sum(axis=1)
+df = points_buffer[points_buffer['year'].between(sample_years[0], sample_years[-1])].copy()
+df['neigh_tot'] = df[neighbourhood_columns].sum(axis=1)
 
 # tidy data
 logging.info("Tidy dat before export")
-del df['key_0'], df['class_re']
-df["geometry"] = df.geometry.centroid
+del df['class_re']
+compact_samples(df)
 
 # exporting ############################################################################################################
-df.to_file(path_data_output / "sample_points/sample_points_0311.gpkg", driver="GPKG")
-df.to_csv(path_data_output / "sample_points/sample_points_0311.csv")
+# year partitioned GeoParquet, read by the model (models/01_models/model.md)
+with stage('export'):
+    count(rows=len(df))
+    write_dataset(df, path_data_output / "sample_points/sample_points_0311.parquet")
+    if export_plot_tables:
+        write_plot_tables(df, path_data_output / "sample_points/sample_points_0311_plots")
+    if export_gpkg:
+        df.to_file(path_data_output / "sample_points/sample_points_0311.gpkg", driver="GPKG")
+        df.to_csv(path_data_output / "sample_points/sample_points_0311.csv")
 
 # end time-count and print time stats ##################################################################################
-end_time = datetime.datetime.now()
-diff = end_time - start_time
-days, seconds = diff.days, diff.seconds
-hours = days * 24 + seconds // 3600
-minutes = (seconds % 3600) // 60
-seconds = seconds % 60
-logging.info(f'The entire process took {days} days, {hours} hours, {minutes} minutes {seconds} seconds')
+run.finish()
@@ -0,0 +1,103 @@
+# !/usr/bin/env python3
+
+# libraries ############################################################################################################
+import logging
+import numpy as np
+import geopandas as gpd
+import rasterio
+import rasterio.features
+import rasterio.windows
+from rasterio.windows import Window
+import blocks
+import instrument
+from parallel import run_parallel
+
+# global variables #####################################################################################################
+# cutlines of a worker process, set once per worker instead of being sent with every year
+worker_cutlines = {}
+
+
+# functions ############################################################################################################
+# window of the cutline bounds on the source grid, rounded out to whole source pixels (gdalwarp -crop_to_cutline
+# keeps the source resolution and pixel alignment)
+def cutline_window(geoms, src):
+    window = rasterio.windows.from_bounds(*geoms.total_bounds, transform=src.transform)
+    window = window.round_offsets(op='floor').round_lengths(op='ceil')
+    return window.intersection(Window(0, 0, src.width, src.height))
+
+
+# read a cutline and rasterize it once on the source grid: (window, mask), mask is True inside the cutline
+# pixels are inside when their centre is, as with gdalwarp -cutline
+def load_cutline(path_cutline, src):
+    geoms = gpd.read_file(path_cutline)
+    if src.crs is not None and geoms.crs is not None and geoms.crs != src.crs:
+        geoms = geoms.to_crs(src.crs)
+
+    window = cutline_window(geoms, src)
+    mask = rasterio.features.geometry_mask(geoms.geometry,
+                                           out_shape=(window.height, window.width),
+                                           transform=rasterio.windows.transform(window, src.transform),
+                                           invert=True)
+    return window, mask
+
+
+# window covering the windows of every cutline, the part of a year that is read
+def union_window(windows):
+    windows = list(windows)
+    row_off = min(w.row_off for w in windows)
+    col_off = min(w.col_off for w in windows)
+    return Window(col_off, row_off,
+                  max(w.col_off + w.width for w in windows) - col_off,
+                  max(w.row_off + w.height for w in windows) - row_off)
+
+
+# cut one cutline out of a read block: pixels outside the cutline are 0 (no nodata set, as gdalwarp -ot Byte writes)
+def apply_cutline(data, data_window, window, mask, fill=0):
+    rows = slice(window.row_off - data_window.row_off, window.row_off - data_window.row_off + window.height)
+    cols = slice(window.col_off - data_window.col_off, window.col_off - data_window.col_off + window.width)
+    return np.where(mask, data[rows, cols], fill)
+
+
+# profile of a cropped raster, same creation options as the rest of the pipeline on the cropped grid
+def crop_profile(src, window, dtype='uint8'):
+    profile = blocks.raster_profile(src, dtype=dtype)
+    profile.update({'width': window.width,
+                    'height': window.height,
+                    'transform': rasterio.windows.transform(window, src.transform)})
+    return profile
+
+
+# pool initializer that hands the rasterized cutlines to a worker process
+def set_cutlines(cutlines):
+    global worker_cutlines
+    worker_cutlines = cutlines
+
+
+# crop one year to every cutline from a single read: (year, path_source, {name: path_out})
+def crop_year(task):
+    year, path_source, outputs = task
+    with instrument.stage('crop_year', year=year), blocks.open_raster(path_source) as src:
+        read_window = union_window(window for window, _ in worker_cutlines.values())
+        data = src.read(1, window=read_window)
+        instrument.count(bytes_read=data.nbytes)
+
+        for name, path_out in outputs.items():
+            window, mask = worker_cutlines[name]
+            cropped = apply_cutline(data, read_window, window, mask).astype('uint8')
+            with rasterio.open(path_out, 'w', **crop_profile(src, window)) as dst:
+                dst.write(cropped, 1)
+            instrument.count(bytes_written=cropped.nbytes)
+
+    logging.info(f"Done cropping {str(year)}")
+
+
+# crop every year to every cutline, each cutline is rasterized once on the source grid and each year is read once
+# rasters: {year: path or virtual raster}, cutlines: {name: path}, outputs: {year: {name: path}}, all sources must
+# share one grid
+def crop_years(rasters, cutlines, outputs, workers=1):
+    with blocks.open_raster(next(iter(rasters.values()))) as src:
+        cutlines = {name: load_cutline(path, src) for name, path in cutlines.items()}
+
+    run_parallel(crop_year, [(year, path, outputs[year]) for year, path in rasters.items()], workers=workers,
+                 initializer=set_cutlines, initargs=(cutlines,))
+
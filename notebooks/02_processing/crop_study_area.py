@@ -0,0 +1,78 @@
+# !/usr/bin/env python3
+
+# libraries ############################################################################################################
+import logging
+import pathlib
+from crop import crop_years
+from parallel import parse_workers
+from years import incremental_years, parse_new_year
+from catalog import RasterCatalog
+from masking import masked_views
+from instrument import start_run, stage, count
+
+# settings #############################################################################################################
+# set logging config
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s %(levelname)-8s %(message)s',
+                    datefmt='%a, %d, %b, %Y, %H:%M:%S',
+                    # filename = 'tidy_data.log'
+                    )
+
+# time, peak memory and io of every stage, logged and written to data/logs/<script>.jsonl
+run = start_run(__file__)
+
+# folder path ##########################################################################################################
+path_current = pathlib.Path.cwd()
+path_src = path_current / 'src'
+path_notebooks = path_current / 'notebooks'
+path_data = path_current / 'data'
+path_data_raw = path_data / '01_raw'
+path_data_inter = path_data / '02_intermediate'
+path_data_output = path_data / '03_processed'
+
+# study areas
+path_study_area = path_data_inter / 'study_area'
+
+# land cover change
+path_lc_change = path_data_inter / 'lc_change'
+
+# deforested plantation pixels, masked back to forest on read
+path_plantation_mask = path_lc_change / 'deforested_92_16_plantantion.tiff'
+
+# landcover
+path_landcover_92_19 = path_data_raw / 'LC_CCI_ESA_COL'
+
+# global variables #####################################################################################################
+# rasters indexed by product, variant and year, metadata cached between runs
+catalog = RasterCatalog([path_landcover_92_19, path_lc_change], path_data_inter / 'raster_catalog.json')
+
+# cutline per study area and the suffix of its cropped rasters
+cutlines = {'study_area': path_study_area / 'study_area.gpkg',
+            'puerto_wilches': path_study_area / 'study_area_puerto_wilches.gpkg',
+            'sabana_torres': path_study_area / 'study_area_sabana_torres.gpkg',
+            'barracanbermeja': path_study_area / 'study_area_barracanbermeja.gpkg'}
+suffixes = {'study_area': '',
+            'puerto_wilches': '_puerto_wilches',
+            'sabana_torres': '_sabana_torres',
+            'barracanbermeja': '_barracanbermeja'}
+
+# number of worker processes (--workers, 0 uses every core)
+workers = parse_workers()
+
+# year ingested incrementally (--new-year), only that year is cropped
+new_year = parse_new_year()
+
+# process ##############################################################################################################
+# land cover read through the plantation mask, no masked copy of the years is written
+rasters = incremental_years(masked_views(catalog.rasters('lc', 'original'), path_plantation_mask), new_year)
+years = list(rasters)
+
+outputs = {year: {name: path_lc_change / f'lc_original_{str(year)}_masked_cropped{suffixes[name]}.tiff'
+                  for name in cutlines}
+           for year in years}
+with stage('crop_years', years=len(years)):
+    count(features=len(cutlines))
+    crop_years(rasters, cutlines, outputs, workers=workers)
+
+# end time-count and print time stats ##################################################################################
+run.finish()
@@ -0,0 +1,65 @@
+# !/usr/bin/env python3
+
+# libraries ############################################################################################################
+import logging
+import pathlib
+import contextlib
+import numpy as np
+import zarr
+from affine import Affine
+from rasterio.windows import Window
+import blocks
+import instrument
+
+# global variables #####################################################################################################
+# spatial chunk size of the cubes, the time axis is never split: a chunk holds every year of its pixels, so reads
+# over all years (e.g. transitions.cube_transitions) decompress each chunk once, while reading one year decompresses
+# every year of the chunks it touches, single years are read from the yearly rasters instead
+chunk_size = 256
+
+
+# functions ############################################################################################################
+# stack yearly rasters into one chunked, compressed time x y x x zarr array with the grid stored once in its attributes
+# rasters: {year: path or virtual raster}, every raster must share one grid, written in strips of whole chunk rows
+def build_cube(rasters, path_cube, chunk_size=chunk_size, memory_budget=blocks.memory_budget):
+    years = sorted(rasters)
+
+    with contextlib.ExitStack() as stack:
+        srcs = [stack.enter_context(blocks.open_raster(rasters[year])) for year in years]
+        blocks.check_grid(srcs)
+        first = srcs[0]
+
+        cube = zarr.open_array(str(path_cube), mode='w',
+                               shape=(len(years), first.height, first.width),
+                               chunks=(len(years), chunk_size, chunk_size),
+                               dtype=first.dtypes[0],
+                               fill_value=first.nodata if first.nodata is not None else 0)
+        cube.attrs.update({'years': [int(year) for year in years],
+                           'transform': list(first.transform.to_gdal()),
+                           'crs': first.crs.to_wkt() if first.crs else None,
+                           'nodata': first.nodata,
+                           'sources': [str(rasters[year]) for year in years]})
+
+        # strips are a whole number of chunk rows high so every chunk is written once
+        bytes_per_row = first.width * np.dtype(first.dtypes[0]).itemsize * len(years)
+        rows = max(chunk_size, (memory_budget // bytes_per_row) // chunk_size * chunk_size)
+        for row_off in range(0, first.height, rows):
+            window = Window(0, row_off, first.width, min(rows, first.height - row_off))
+            strip = np.stack([src.read(1, window=window) for src in srcs])
+            cube[:, row_off:row_off + window.height, :] = strip
+            instrument.count(bytes_read=strip.nbytes)
+
+    logging.info(f"Done building cube {pathlib.Path(path_cube).name} for {years[0]} - {years[-1]}")
+
+
+def open_cube(path_cube):
+    return zarr.open_array(str(path_cube), mode='r')
+
+
+def cube_years(cube):
+    return list(cube.attrs['years'])
+
+
+def cube_transform(cube):
+    return Affine.from_gdal(*cube.attrs['transform'])
+
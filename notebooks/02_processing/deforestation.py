@@ -3,9 +3,11 @@
 # libraries ############################################################################################################
 import logging
 import pathlib
-import datetime
-from osgeo import gdal
-import numpy as np
+from parallel import parse_workers
+from years import incremental_years, parse_new_year
+from catalog import RasterCatalog
+from change import change_detection, deforestation, reforestation
+from instrument import start_run, stage
 
 # settings #############################################################################################################
 # set logging config
@@ -15,33 +17,11 @@ logging.basicConfig(level=logging.INFO,
                     # filename = 'tidy_data.log'
                     )
 
-# set time count
-start_time = datetime.datetime.now()
-logging.info("Starting process")
+# time, peak memory and io of every stage, logged and written to data/logs/<script>.jsonl
+run = start_run(__file__)
 
 
 # functions ############################################################################################################
-def get_files(patterns, data_path):
-    all_files = []
-    for pat in patterns:
-        all_files.extend(data_path.glob(pat))
-    return all_files
-
-
-def make_raster(in_ds, fn, data, data_type, nr_bands, nodata=None):
-    driver = gdal.GetDriverByName('GTiff')
-    out_ds = driver.Create(fn, in_ds.RasterXSize, in_ds.RasterYSize, nr_bands, data_type,
-                           ['COMPRESS=DEFLATE',
-                            'PREDICTOR=2',
-                            'TILED=YES'])
-    out_ds.SetProjection(in_ds.GetProjection())
-    out_ds.SetGeoTransform(in_ds.GetGeoTransform())
-    out_ds.GetRasterBand(1).WriteArray(data[0])
-    out_ds.FlushCache()
-    out_ds = None
-    return out_ds
-
-
 # folder path ##########################################################################################################
 path_current = pathlib.Path.cwd()
 path_src = path_current / 'src'
@@ -55,68 +35,28 @@ path_data_output = path_data/'03_processed'
 path_landcover_92_19 = path_data_raw / 'LC_CCI_ESA_COL'
 
 # global variables #####################################################################################################
-file_format = '*.tif'
-pattern_data = ('*v2.0.7.crop*', '*v2.1.1*')
-pattern_qa = '*qualityflag*'
+# rasters indexed by product, variant and year, metadata cached between runs
+catalog = RasterCatalog([path_landcover_92_19, path_data_inter / 'lc_change'], path_data_inter / 'raster_catalog.json')
 
-files_all = path_landcover_92_19.glob(file_format)
-files_all_list = list(path_landcover_92_19.glob(file_format))
+# bytes of raster data held at once
+memory_budget = 256 * 2 ** 20
 
-files_data_list = get_files(pattern_data, path_landcover_92_19)
-files_data = (y for y in files_data_list)
+# number of worker processes (--workers, 0 uses every core)
+workers = parse_workers()
 
-files_qa = path_data.glob(pattern_qa)
-files_qa_list = list(path_landcover_92_19.glob(pattern_qa))
+# year ingested incrementally (--new-year), only its transition from the year before is computed
+new_year = parse_new_year()
 
 # process ##############################################################################################################
-# create binary change raster without modifying original classes
-for year in range(1992, 2019):
-    # input Raster
-    raster_old_path = [lc for lc in files_data_list if str(year) in str(lc)]
-    raster_new_path = [lc for lc in files_data_list if str(year + 1) in str(lc)]
-
-    # open raster files
-    raster_old = gdal.Open(str(raster_old_path[0]))
-    raster_new = gdal.Open(str(raster_new_path[0]))
-
-    # read bands as matrix arrays
-    raster_old_data = raster_old.GetRasterBand(1).ReadAsArray().astype(int)
-    raster_new_data = raster_new.GetRasterBand(1).ReadAsArray().astype(int)
-
-    # reclassify crop classes
-    raster_old_data[np.where(raster_old_data == 11)] = 10
-    raster_new_data[np.where(raster_new_data == 11)] = 10
-
-    # reclassify forest classes
-    raster_old_data[np.where(raster_old_data == 50)] = 5000
-    raster_new_data[np.where(raster_new_data == 50)] = 5000
-
-    # create a land cover change image
-    lcChange = raster_new_data - raster_old_data
-
-    # reclassify
-    lcChange[np.where(lcChange > -4000)] = 0
-    lcChange = 5000 + lcChange
-    lcChange[np.where(lcChange == 5000)] = 0
-
-    # add dimension in order to export
-    lcChange = np.reshape(lcChange, newshape=(1, raster_old.RasterYSize, raster_old.RasterXSize))
-    make_raster(in_ds=raster_old,
-                fn=str(path_data_inter / f'lc_change/landcover_change_{str(year)}_{str(year + 1)}_deforest.tiff'),
-                data=lcChange,
-                data_type=gdal.GDT_Int16,
-                nr_bands=1,
-                nodata=None)
-
-    # logging info
-    logging.info(f"Done processing deforestation from {str(year)} to {str(year + 1)}")
+# create de- and reforestation change rasters without modifying original classes, reading every year once
+rasters = incremental_years(catalog.rasters('lc', 'original'), new_year, n_before=1)
+with stage('change_detection', years=len(rasters)):
+    change_detection(rasters,
+                     products={'deforest': deforestation, 'reforest': reforestation},
+                     out_pattern=path_data_inter / 'lc_change/landcover_change_{year_old}_{year_new}_{product}.tiff',
+                     memory_budget=memory_budget,
+                     workers=workers)
 
 # exporting ############################################################################################################
 # end time-count and print time stats ##################################################################################
-end_time = datetime.datetime.now()
-diff = end_time - start_time
-days, seconds = diff.days, diff.seconds
-hours = days * 24 + seconds // 3600
-minutes = (seconds % 3600) // 60
-seconds = seconds % 60
-logging.info(f'The entire process took {days} days, {hours} hours, {minutes} minutes {seconds} seconds')
+run.finish()
@@ -0,0 +1,98 @@
+# !/usr/bin/env python3
+
+# libraries ############################################################################################################
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+
+# functions ############################################################################################################
+# distance from every point to its nearest feature plus the id of that feature, answered with one bulk STRtree query
+# points and features must share a projected crs, points without a feature within max_distance get NaN
+def nearest_feature(points, features, max_distance=None, id_column=None):
+    if points.crs != features.crs:
+        raise ValueError(f"points ({points.crs}) and features ({features.crs}) must share a crs")
+
+    features = features[~(features.geometry.is_empty | features.geometry.isna())]
+    ids = features.index.values if id_column is None else features[id_column].values
+
+    distance = np.full(len(points), np.nan)
+    nearest_id = pd.Series(pd.NA, index=range(len(points)), dtype=object)
+    if len(features) > 0:
+        (point_idx, feature_idx), dist = features.sindex.nearest(points.geometry,
+                                                                 return_all=False,
+                                                                 max_distance=max_distance,
+                                                                 return_distance=True)
+        distance[point_idx] = dist
+        nearest_id.iloc[point_idx] = ids[feature_idx]
+
+    return pd.DataFrame({'distance': distance,
+                         'nearest_id': nearest_id.values},
+                        index=points.index)
+
+
+# x/y array of point geometries, distances between them are only meaningful in a projected crs
+def point_coords(points):
+    if points.crs is not None and not points.crs.is_projected:
+        raise ValueError(f"points must be in a projected crs (e.g. EPSG:3116), got {points.crs}")
+    return np.column_stack([points.geometry.x.values, points.geometry.y.values])
+
+
+# distance to the k nearest target points (n x k) and number of targets within radius, from one KD-tree query pass
+def query_targets(tree, coords, k=1, max_distance=np.inf, radius=None):
+    distance, _ = tree.query(coords, k=k, distance_upper_bound=max_distance, workers=-1)
+    distance = np.where(np.isinf(distance), np.nan, distance).reshape(len(coords), k)
+    count = None
+    if radius is not None:
+        count = tree.query_ball_point(coords, r=radius, return_length=True, workers=-1).astype(np.int64)
+    return distance, count
+
+
+def distance_columns(k):
+    return ['distance'] if k == 1 else [f'distance_{i}' for i in range(1, k + 1)]
+
+
+# distance to the k nearest target points (columns distance_1 .. distance_k), NaN where there is no target in reach
+def nearest_points(points, targets, k=1, max_distance=np.inf):
+    if len(targets) == 0 or len(points) == 0:
+        return pd.DataFrame(np.nan, index=points.index, columns=distance_columns(k))
+
+    distance, _ = query_targets(cKDTree(point_coords(targets)), point_coords(points), k=k, max_distance=max_distance)
+    return pd.DataFrame(distance, index=points.index, columns=distance_columns(k))
+
+
+# number of target points within radius of every point
+def count_within(points, targets, radius):
+    if len(targets) == 0 or len(points) == 0:
+        return pd.Series(0, index=points.index, dtype=np.int64)
+
+    _, count = query_targets(cKDTree(point_coords(targets)), point_coords(points), radius=radius)
+    return pd.Series(count, index=points.index)
+
+
+# distance to (and optionally count within radius of) the previous year's events, one KD-tree per year
+# points need a year column, event is a boolean mask of the event points (e.g. afforestation == 1)
+# rows come back in the order of points, rows outside years are NaN (distance and count), in a year without events
+# the year before the distance is NaN and the count 0
+def previous_year_events(points, event, years, k=1, radius=None):
+    year = points['year'].values
+    event = np.asarray(event, dtype=bool)
+    coords = point_coords(points)
+
+    distance = np.full((len(points), k), np.nan)
+    count = np.full(len(points), np.nan)
+    for y in years:
+        current = year == y
+        past = (year == y - 1) & event
+        count[current] = 0
+        if not current.any() or not past.any():
+            continue
+
+        distance[current], count_year = query_targets(cKDTree(coords[past]), coords[current], k=k, radius=radius)
+        if radius is not None:
+            count[current] = count_year
+
+    df = pd.DataFrame(distance, index=points.index, columns=distance_columns(k))
+    if radius is not None:
+        df['count'] = count
+    return df
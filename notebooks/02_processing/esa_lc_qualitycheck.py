@@ -0,0 +1,120 @@
+# !/usr/bin/env python3
+
+# libraries ############################################################################################################
+import logging
+import pathlib
+import contextlib
+import numpy as np
+import rasterio
+from blocks import check_grid, raster_profile, strip_windows
+from catalog import RasterCatalog
+from instrument import start_run, stage, count
+
+# settings #############################################################################################################
+# set logging config
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s %(levelname)-8s %(message)s',
+                    datefmt='%a, %d, %b, %Y, %H:%M:%S',
+                    # filename = 'tidy_data.log'
+                    )
+
+# time, peak memory and io of every stage, logged and written to data/logs/<script>.jsonl
+run = start_run(__file__)
+
+
+# functions ############################################################################################################
+# quality checks of the 2003 - 2019 transitions in one pass: every strip of every change raster is read once and all
+# accumulators are updated from it in place, only the accumulators and one strip are held in memory
+# reforest / deforest: lists of change raster paths, outputs: {name: path}
+def quality_check(reforest, deforest, outputs):
+    with contextlib.ExitStack() as stack:
+        srcs_reforest = [stack.enter_context(rasterio.open(path)) for path in reforest]
+        srcs_deforest = [stack.enter_context(rasterio.open(path)) for path in deforest]
+        check_grid(srcs_reforest + srcs_deforest)
+
+        profile = raster_profile(srcs_reforest[0], dtype='int16')
+        dsts = {name: stack.enter_context(rasterio.open(path, 'w', **profile)) for name, path in outputs.items()}
+
+        # reforest / deforest event counts (uint8) and the summed reforest classes (int16) plus one strip read
+        for window in strip_windows(srcs_reforest[0], n_arrays=4, itemsize=2, memory_budget=memory_budget):
+            shape = (window.height, window.width)
+            n_reforest = np.zeros(shape, dtype=np.uint8)
+            n_deforest = np.zeros(shape, dtype=np.uint8)
+            reforested = np.zeros(shape, dtype=np.int16)
+
+            for src in srcs_reforest:
+                data = src.read(1, window=window)
+                n_reforest += data != 0
+                reforested += data
+            for src in srcs_deforest:
+                data = src.read(1, window=window)
+                n_deforest += data != 0
+            count(bytes_read=data.nbytes * (len(srcs_reforest) + len(srcs_deforest)))
+
+            # pixels with any re- / deforestation, and with both (0, 1 or 2)
+            any_reforest = (n_reforest > 0).astype(np.int16)
+            any_deforest = (n_deforest > 0).astype(np.int16)
+            results = {'double_reforested': any_reforest,
+                       'double_deforested': any_deforest,
+                       'de_and_aff': any_reforest + any_deforest,
+                       'reforested': reforested,
+                       'reforest_events': n_reforest,
+                       'deforest_events': n_deforest}
+            for name, dst in dsts.items():
+                dst.write(results[name].astype('int16'), 1, window=window)
+
+
+# folder path ##########################################################################################################
+path_current = pathlib.Path.cwd()
+path_src = path_current / 'src'
+path_notebooks = path_current / 'notebooks'
+path_data = path_current / 'data'
+path_data_raw = path_data / '01_raw'
+path_data_inter = path_data / '02_intermediate'
+path_data_output = path_data / '03_processed'
+
+# study areas
+path_munic = path_data_inter / 'study_area/municipalties_SA.gpkg'
+path_catch = path_data_inter / 'study_area/catchments_SA.gpkg'
+path_river = path_data_inter / 'study_area/river_buffer.gpkg'
+
+# landcover
+path_landcover_92_19 = path_data_raw / 'LC_CCI_ESA_COL'
+# global variables #####################################################################################################
+# rasters indexed by product, variant and year, metadata cached between runs
+catalog = RasterCatalog([path_landcover_92_19, path_data_inter / 'lc_change'], path_data_inter / 'raster_catalog.json')
+
+# transitions from 2003 - 2004 on
+files_reforest_list_sp = list(catalog.rasters('change', 'reforest', first=2003, last=2019).values())
+files_deforest_list_sp = list(catalog.rasters('change', 'deforest', first=2003, last=2019).values())
+
+# bytes of raster data held at once
+memory_budget = 256 * 2 ** 20
+# process ##############################################################################################################
+'''
+# Read metadata of first file
+with rasterio.open(files_reforest_list[0]) as src0:
+    meta = src0.meta
+
+# Update meta to reflect the number of layers
+meta.update(count=len(files_reforest_list))
+
+# Read each layer and write it to stack
+with rasterio.open('reforest_stack.tif', 'w', **meta) as dst:
+    for id, layer in enumerate(files_reforest_list, start=1):
+        with rasterio.open(layer) as src1:
+            dst.write_band(id, src1.read(1))
+'''
+# exporting ############################################################################################################
+# all checks from one read of every change raster
+with stage('quality_check', years=len(files_reforest_list_sp)):
+    quality_check(files_reforest_list_sp, files_deforest_list_sp,
+                  {'double_reforested': path_data_inter / 'lc_change/double_reforested_03_19.tiff',
+                   'double_deforested': path_data_inter / 'lc_change/double_deforested_03_19.tiff',
+                   'de_and_aff': path_data_inter / 'lc_change/de_and_aff_03_19.tiff',
+                   'reforested': path_data_inter / 'lc_change/reforested_03_19.tiff',
+                   'reforest_events': path_data_inter / 'lc_change/reforest_events_03_19.tiff',
+                   'deforest_events': path_data_inter / 'lc_change/deforest_events_03_19.tiff'})
+
+# end time-count and print time stats ##################################################################################
+run.finish()
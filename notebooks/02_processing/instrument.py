@@ -0,0 +1,209 @@
+# !/usr/bin/env python3
+
+# libraries ############################################################################################################
+import os
+import sys
+import argparse
+import json
+import atexit
+import time
+import logging
+import pathlib
+import datetime
+import resource
+import contextlib
+import tracemalloc
+
+# global variables #####################################################################################################
+# run of this process, started by the script, forked workers inherit it and write their stages to the same file
+current_run = None
+
+# stages open in this process, innermost last
+open_stages = []
+
+
+# functions ############################################################################################################
+# follow python / numpy allocations with tracemalloc (--trace-memory), off by default: tracing slows allocation heavy
+# code (pandas, dicts, lists) several times over, the peak resident memory is measured either way
+def parse_trace_memory(default=False):
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--trace-memory', action='store_true', default=default)
+    args, _ = parser.parse_known_args()
+    return args.trace_memory
+
+
+# peak resident memory of the process in bytes, since the last reset_peak_rss on linux, since the start elsewhere
+def peak_rss():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+# start measuring the peak resident memory again (linux only)
+def reset_peak_rss():
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+# fold the peaks measured so far into the innermost open stage and start measuring new peaks, so every stage ends
+# up with the peak of its own span including the spans of its sub-stages
+def collect_peaks():
+    if open_stages:
+        frame = open_stages[-1]
+        frame.peak_rss = max(frame.peak_rss, peak_rss())
+        if tracemalloc.is_tracing():
+            frame.peak_traced = max(frame.peak_traced, tracemalloc.get_traced_memory()[1])
+    reset_peak_rss()
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+
+
+# add to the counters of the innermost open stage, e.g. count(bytes_read=data.nbytes), without a run nothing is kept
+def count(**counters):
+    if open_stages:
+        open_stages[-1].count(**counters)
+
+
+# short text of an exception for the error field of a record
+def error_text(error):
+    return f'{type(error).__name__}: {error}'
+
+
+# one timed stage: wall time, peak memory and counters (raster bytes read and written, features, rows, ...)
+class Stage:
+
+    def __init__(self, name, attrs):
+        self.name = '/'.join([frame.name for frame in open_stages[-1:]] + [name])
+        self.attrs = attrs
+        self.counters = {}
+        self.peak_rss = 0
+        self.peak_traced = 0
+        self.started = datetime.datetime.now()
+        self.start = time.perf_counter()
+        self.seconds = None
+
+    def count(self, **counters):
+        for key, value in counters.items():
+            self.counters[key] = self.counters.get(key, 0) + int(value)
+
+    # json record of the finished stage
+    def record(self):
+        return {'run': current_run.run_id if current_run else None,
+                'script': current_run.name if current_run else None,
+                'stage': self.name,
+                'pid': os.getpid(),
+                'started': self.started.isoformat(timespec='seconds'),
+                'seconds': round(self.seconds, 4),
+                'peak_rss_mb': round(self.peak_rss / 2 ** 20, 1),
+                'peak_traced_mb': round(self.peak_traced / 2 ** 20, 1) if self.peak_traced else None,
+                **self.counters,
+                **self.attrs}
+
+
+# time a stage and its sub-stages: with stage('mask', year=2005): ...
+# counters of a finished stage are added to its parent, stages opened in forked workers are written by the worker
+# (with its pid) and their counters stay there
+@contextlib.contextmanager
+def stage(name, **attrs):
+    collect_peaks()
+    frame = Stage(name, attrs)
+    open_stages.append(frame)
+    try:
+        yield frame
+    except BaseException as error:
+        frame.attrs['error'] = error_text(error)
+        raise
+    finally:
+        frame.seconds = time.perf_counter() - frame.start
+        collect_peaks()
+        open_stages.pop()
+        if open_stages:
+            parent = open_stages[-1]
+            parent.count(**frame.counters)
+            parent.peak_rss = max(parent.peak_rss, frame.peak_rss)
+            parent.peak_traced = max(parent.peak_traced, frame.peak_traced)
+
+        record = frame.record()
+        counters = ', '.join(f'{key} {value:,}' for key, value in frame.counters.items())
+        logging.info(f"{frame.name}: {record['seconds']:.2f} s, peak rss {record['peak_rss_mb']} MB"
+                     + (f", {counters}" if counters else ''))
+        if current_run is not None:
+            current_run.write(record)
+
+
+# the whole run of a script, its stages are appended as json lines to path_json (one line per finished stage)
+class Run:
+
+    def __init__(self, name, path_json, trace_memory=False):
+        self.name = name
+        self.path_json = pathlib.Path(path_json)
+        self.run_id = f"{datetime.datetime.now().strftime('%Y%m%dT%H%M%S')}_{os.getpid()}"
+        self.path_json.parent.mkdir(parents=True, exist_ok=True)
+        self.stack = contextlib.ExitStack()
+        self.finished = False
+        self.error = None
+        self.excepthook = None
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.traced = tracemalloc.is_tracing()
+
+    def write(self, record):
+        # one write per line, lines of workers appending at once do not interleave
+        with open(self.path_json, 'a') as f:
+            f.write(json.dumps(record, default=str) + '\n')
+
+    # close the stage of the whole script and log the total time as the scripts always did, a failed run is closed at
+    # exit with the error in its record
+    def finish(self):
+        if self.finished:
+            return
+        self.finished = True
+        if self.excepthook is not None:
+            sys.excepthook = self.excepthook
+        started = open_stages[0].started
+        if self.error is not None:
+            open_stages[0].attrs['error'] = self.error
+            logging.error(f"{self.name} failed: {self.error}")
+        self.stack.close()
+        diff = datetime.datetime.now() - started
+        days, seconds = diff.days, diff.seconds
+        hours = days * 24 + seconds // 3600
+        minutes = (seconds % 3600) // 60
+        seconds = seconds % 60
+        logging.info(f'The entire process took {days} days, {hours} hours, {minutes} minutes {seconds} seconds')
+
+
+# start the run of a script (pass __file__), its stages are written to data/logs/<script>.jsonl under the working
+# directory, the whole script is the outermost stage until run.finish()
+# trace_memory: also record the tracemalloc peak of every stage, several times slower on allocation heavy code, so
+# timings of traced runs are not comparable, defaults to the --trace-memory flag
+def start_run(script, path_json=None, trace_memory=None):
+    global current_run
+    name = pathlib.Path(script).stem
+    if path_json is None:
+        path_json = pathlib.Path.cwd() / 'data' / 'logs' / f'{name}.jsonl'
+    if trace_memory is None:
+        trace_memory = parse_trace_memory()
+    run = current_run = Run(name, path_json, trace_memory=trace_memory)
+    run.stack.enter_context(stage(name))
+
+    # a script that raises never reaches run.finish(), remember its error and close the run before the interpreter
+    # shuts down so the record of the whole script is still written, finish() puts the previous hook back
+    run.excepthook = sys.excepthook
+
+    def record_error(kind, error, traceback):
+        run.error = error_text(error)
+        run.excepthook(kind, error, traceback)
+
+    sys.excepthook = record_error
+    atexit.register(run.finish)
+    logging.info("Starting process")
+    return run
@@ -0,0 +1,120 @@
+# !/usr/bin/env python3
+
+# libraries ############################################################################################################
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+
+# global variables #####################################################################################################
+# an ESA CCI land cover class: code, column name in the catchment tables (main_lc.py), short column name in the study
+# area tables (O1_*.py), code of the class it is summarized into in the catchment tables (only 11 into 10, as
+# change.reclassify does, every other class is its own) and whether the pipeline counts it as forest
+LandCoverClass = namedtuple('LandCoverClass', ['code', 'name', 'short', 'group', 'forest'])
+
+registry = {lc_class.code: lc_class for lc_class in [
+    LandCoverClass(0, 'no_data', 'unknown', 0, False),
+    LandCoverClass(10, 'cropland_rainfed', 'crop', 10, False),
+    LandCoverClass(11, 'herbaceous_cover', 'herb', 10, False),
+    LandCoverClass(12, 'tree_or_shrub_cover', 'tree_shrub', 12, False),
+    LandCoverClass(20, 'cropland_irrigated', 'crop_irrigated', 20, False),
+    LandCoverClass(30, 'mosaic_cropland', 'mosaic_crop', 30, False),
+    LandCoverClass(40, 'mosaic_natural_vegetation', 'mosaic_natural', 40, False),
+    LandCoverClass(50, 'tree_cover_evergreen', 'tree', 50, True),
+    LandCoverClass(60, 'tree_cover_deciduous', 'tree_deciduous', 60, False),
+    LandCoverClass(61, 'tree_cover_deciduous_closed', 'tree_deciduous_closed', 61, False),
+    LandCoverClass(62, 'tree_cover_deciduous_open', 'tree_deciduous_open', 62, False),
+    LandCoverClass(70, 'tree_cover_needleleaved_evergreen', 'tree_needle_evergreen', 70, False),
+    LandCoverClass(71, 'tree_cover_needleleaved_evergreen_closed', 'tree_needle_evergreen_closed', 71, False),
+    LandCoverClass(72, 'tree_cover_needleleaved_evergreen_open', 'tree_needle_evergreen_open', 72, False),
+    LandCoverClass(80, 'tree_cover_needleleaved_deciduous', 'tree_needle_deciduous', 80, False),
+    LandCoverClass(81, 'tree_cover_needleleaved_deciduous_closed', 'tree_needle_deciduous_closed', 81, False),
+    LandCoverClass(82, 'tree_cover_needleleaved_deciduous_open', 'tree_needle_deciduous_open', 82, False),
+    LandCoverClass(90, 'tree_cover_mixed', 'tree_mixed', 90, False),
+    LandCoverClass(100, 'mosaic_tree_and_shrub', 'mosaic_tree', 100, False),
+    LandCoverClass(110, 'mosaic_herbaceous', 'mosaic_herb', 110, False),
+    LandCoverClass(120, 'shrubland', 'shrubland', 120, False),
+    LandCoverClass(121, 'shrubland_evergreen', 'shrubland_evergreen', 121, False),
+    LandCoverClass(122, 'shrubland_deciduous', 'shrubland_deciduous', 122, False),
+    LandCoverClass(130, 'grassland', 'grassland', 130, False),
+    LandCoverClass(140, 'lichens_and_mosses', 'lichens', 140, False),
+    LandCoverClass(150, 'sparse_vegetation', 'sparse', 150, False),
+    LandCoverClass(151, 'sparse_tree', 'sparse_tree', 151, False),
+    LandCoverClass(152, 'sparse_shrub', 'sparse_shrub', 152, False),
+    LandCoverClass(153, 'sparse_herbaceous_cover', 'sparse_herb', 153, False),
+    LandCoverClass(160, 'tree_cover_flooded_fresh', 'tree_flood_fresh', 160, False),
+    LandCoverClass(170, 'tree_cover_flooded_saline', 'tree_flood_saline', 170, False),
+    LandCoverClass(180, 'shrub_herbaceous_cover_flooded', 'shrub_flooded', 180, False),
+    LandCoverClass(190, 'urban_areas', 'urban', 190, False),
+    LandCoverClass(200, 'bare_areas', 'bare', 200, False),
+    LandCoverClass(201, 'consolidated_bare_areas', 'bare_consolidated', 201, False),
+    LandCoverClass(202, 'unconsolidated_bare_areas', 'bare_unconsolidated', 202, False),
+    LandCoverClass(210, 'water_bodies', 'water', 210, False),
+    LandCoverClass(220, 'permanent_snow_and_ice', 'snow_ice', 220, False),
+]}
+
+# classes summarized into another in the catchment tables, {11: 10}
+crop_groups = {code: lc_class.group for code, lc_class in registry.items() if lc_class.group != code}
+
+# classes of the catchment tables (main_lc.py), after summarizing 11 into 10
+catchment_classes = [10, 30, 40, 50, 60, 100, 110, 120, 130, 160, 170, 180, 190, 210]
+
+# classes re- and afforestation starts from in the catchment tables
+reforest_classes = [10, 30, 40, 110, 120, 130, 180, 210]
+
+# classes of the study area tables (O1_*.py), 10 and 11 kept apart
+study_area_classes = [10, 11, 30, 40, 50, 120, 160, 170, 180, 210, 0, 100, 110, 130, 190]
+
+# study area classes that can be afforested
+available_classes = [10, 11, 30, 40, 120]
+
+
+# functions ############################################################################################################
+# {code: column name} of classes, names='name' or 'short', plus a suffix (e.g. '_reforest')
+def class_names(classes, names='name', suffix=''):
+    return {code: getattr(registry[code], names) + suffix for code in classes}
+
+
+# codes of the classes the pipeline counts as forest
+def forest_classes():
+    return [code for code, lc_class in registry.items() if lc_class.forest]
+
+
+# count columns of a zonal count table (one column per class code) summarized as groups says ({code: into}, e.g.
+# crop_groups), the summarized columns are dropped
+def group_counts(df, groups):
+    members = [code for code in df.columns if code in groups]
+    for code in members:
+        group = groups[code]
+        df[group] = (df[group] if group in df.columns else 0) + df[code].fillna(0)
+    return df.drop(columns=members)
+
+
+# class counts, their total and shares of a zonal count table from one count matrix: the counts of classes (summarized
+# by groups first, missing classes count 0) are renamed to their names + suffix, the total (optional) and the shares
+# (<name><suffix>_share, NaN where the total is 0 unless fill_shares is given) are appended
+def composition(df, classes, names='name', suffix='', groups=None, total=None, fill_shares=None):
+    if groups:
+        df = group_counts(df, groups)
+    counts = df.reindex(columns=classes).fillna(0).to_numpy(dtype=np.int64)
+    row_total = counts.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shares = counts / row_total[:, np.newaxis]
+    if fill_shares is not None:
+        shares[np.isnan(shares)] = fill_shares
+
+    df = df.copy()
+    df[classes] = counts
+    columns = class_names(classes, names, suffix)
+    appended = pd.DataFrame(shares, columns=[f'{name}_share' for name in columns.values()], index=df.index)
+    if total is not None:
+        appended.insert(0, total, row_total)
+    return pd.concat([df.rename(columns=columns), appended], axis=1)
+
+
+# transition probabilities <name>_tp: the events of a class (column <name><event_suffix>) over its count (<name>)
+def transition_probabilities(df, classes, event_suffix, names='name'):
+    columns = list(class_names(classes, names).values())
+    events = df[[f'{name}{event_suffix}' for name in columns]].to_numpy(dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        tp = events / df[columns].to_numpy(dtype=np.float64)
+    return pd.concat([df, pd.DataFrame(tp, columns=[f'{name}_tp' for name in columns], index=df.index)], axis=1)
@@ -3,13 +3,19 @@
 # libraries ############################################################################################################
 import logging
 import pathlib
-import datetime
 import numpy as np
 import rasterio
-import rasterio.mask
+import rasterio.features
+import rasterio.windows
+from shapely.geometry import box
 
 import geopandas as gpd
-from osgeo import gdal
+from blocks import stream_blocks
+from parallel import parse_workers, run_parallel
+from years import incremental_years, parse_new_year
+from catalog import RasterCatalog
+from masking import mask_plantation
+from instrument import start_run, stage, count
 
 # settings #############################################################################################################
 # set logging config
@@ -19,36 +25,45 @@ logging.basicConfig(level=logging.INFO,
                     # filename = 'tidy_data.log'
                     )
 
-# set time count
-start_time = datetime.datetime.now()
-logging.info("Starting process")
+# time, peak memory and io of every stage, logged and written to data/logs/<script>.jsonl
+run = start_run(__file__)
 
 
 # functions ############################################################################################################
-def get_files(patterns):
-    all_files = []
-    for pat in patterns:
-        all_files.extend(path_landcover_92_19.glob(pat))
-    return all_files
+# 1000 where a plantation pixel was deforested (sum of deforest classes > 0), 0 elsewhere, for one strip
+def plantation_deforested(window, deforested):
+    transform = rasterio.windows.transform(window, grid_transform)
+    window_box = box(*rasterio.windows.bounds(window, grid_transform))
+    geoms = plantation.geometry.iloc[plantation.sindex.query(window_box)]
+    if len(geoms) == 0:
+        return np.zeros(deforested.shape, dtype=np.int16)
 
+    in_plantation = rasterio.features.geometry_mask(geoms, out_shape=deforested.shape, transform=transform, invert=True)
+    return np.where(in_plantation & (deforested > 0), 1000, 0).astype(np.int16)
 
-def read_file(file):
-    with rasterio.open(file) as src:
-        return src.read(1)
 
+# summed deforest classes 1992 - 2016 and their deforested plantation pixels, for one strip
+def deforested_92_16(window, *deforest):
+    deforested = np.sum(deforest, axis=0, dtype=np.int32)
+    return {'deforested': deforested,
+            'plantation': plantation_deforested(window, deforested)}
 
-def make_raster(in_ds, fn, data, data_type, nr_bands, nodata=None):
-    driver = gdal.GetDriverByName('GTiff')
-    out_ds = driver.Create(fn, in_ds.RasterXSize, in_ds.RasterYSize, nr_bands, data_type,
-                           ['COMPRESS=DEFLATE',
-                            'PREDICTOR=2',
-                            'TILED=YES'])
-    out_ds.SetProjection(in_ds.GetProjection())
-    out_ds.SetGeoTransform(in_ds.GetGeoTransform())
-    out_ds.GetRasterBand(1).WriteArray(data[0])
-    out_ds.FlushCache()
-    out_ds = None
-    return out_ds
+
+# land cover with deforested plantation pixels reclassified back to forest, for one strip
+def masked_strip(window, lc, plantation_mask):
+    return {'masked': mask_plantation(lc, plantation_mask)}
+
+
+# write a masked copy of one year, deforested plantation pixels reclassified to forest class
+def mask_year(year):
+    with stage('mask_year', year=year):
+        stream_blocks([catalog.get('lc', 'original', year), path_plantation_mask],
+                      {'masked': path_data_inter / f'lc_change/lc_original_{str(year)}_masked.tiff'},
+                      masked_strip,
+                      memory_budget=memory_budget)
+
+    # logging info
+    logging.info(f"Done masking {str(year)}")
 
 
 # folder path ##########################################################################################################
@@ -71,38 +86,36 @@ path_palm_planted = path_data_raw / 'palm_oil' / 'plantations_v1_3_dl.gdb'
 
 # landcover
 path_landcover_92_19 = path_data_raw / 'LC_CCI_ESA_COL'
-# global variables #####################################################################################################
-file_format = '*.tif'
-pattern_data = ('*v2.0.7.crop*', '*v2.1.1*')
-pattern_qa = '*qualityflag*'
-pattern_reforest = '*reforest.tiff*'
-pattern_deforest = '*deforest.tiff*'
 
-files_all = path_landcover_92_19.glob(file_format)
-files_all_list = list(path_landcover_92_19.glob(file_format))
+# deforested plantation pixels (1000) on the land cover grid, the mask every stage reads the land cover through
+path_plantation_mask = path_data_inter / 'lc_change/deforested_92_16_plantantion.tiff'
+# global variables #####################################################################################################
+# rasters indexed by product, variant and year, metadata cached between runs
+catalog = RasterCatalog([path_landcover_92_19, path_data_inter / 'lc_change'], path_data_inter / 'raster_catalog.json')
 
-files_data_list = get_files(pattern_data)
-files_data = (y for y in files_data_list)
+# deforestation of the transitions from 1992 - 2016
+files_deforest_list_sp = list(catalog.rasters('change', 'deforest', first=1992, last=2015).values())
 
-files_qa = path_data.glob(pattern_qa)
-files_qa_list = list(path_landcover_92_19.glob(pattern_qa))
+plantation_area = 0.025628368675795276
 
-files_reforest_list = list((path_data_inter / 'lc_change').glob(pattern_reforest))
-files_reforest = (path_data_inter / 'lc_change').glob(pattern_reforest)
+# bytes of raster data held at once
+memory_budget = 256 * 2 ** 20
 
-files_deforest_list = list((path_data_inter / 'lc_change').glob(pattern_deforest))
-files_deforest = (path_data_inter / 'lc_change').glob(pattern_reforest)
+# number of worker processes (--workers, 0 uses every core)
+workers = parse_workers()
 
-years = [str(i) for i in range(1992, 2016)]
-files_reforest_list_sp = [s for s in files_reforest_list if any(xs in str(s) for xs in years)]
-files_deforest_list_sp = [s for s in files_deforest_list if any(xs in str(s) for xs in years)]
+# year ingested incrementally (--new-year), the 1992 - 2016 plantation mask is reused and only that year is masked
+new_year = parse_new_year()
 
-plantation_area = 0.025628368675795276
+# also write a masked copy of every year (lc_original_<year>_masked.tiff), the pipeline itself reads the land cover
+# through the plantation mask (masking.MaskedView) and does not need them
+write_masked = False
 # load data ############################################################################################################
 # palm areas areas
 logging.info("loading planted trees")
 # fiona.listlayers(path_palm_planted)
-palm_planted = gpd.read_file(path_palm_planted, driver='FileGDB', layer='col_plant')
+with stage('load_plantations'):
+    palm_planted = gpd.read_file(path_palm_planted, driver='FileGDB', layer='col_plant')
 # palm_planted.to_crs(epsg=3116, inplace=True)
 
 # filter plantation
@@ -110,70 +123,25 @@ logging.info("filter plantation")
 plantation = palm_planted.loc[palm_planted['Shape_Area'] == plantation_area]
 del palm_planted
 # process ##############################################################################################################
-# deforestation from 1992 - 2016
-array_list = [read_file(x) for x in files_deforest_list_sp]
-
-# summarize afforestation in one raster
-deforestation_92_16 = np.sum(array_list, axis=0)
-np.unique(deforestation_92_16)
-del array_list
-
-with rasterio.open(files_reforest_list[0]) as src:
-    meta = src.meta
-
-with rasterio.open(path_data_inter / 'lc_change/deforested_92_16.tiff', 'w', **meta) as dst:
-    dst.write(deforestation_92_16.astype(rasterio.int16), 1)
-
-
-with rasterio.open(path_data_inter / 'lc_change/deforested_92_16.tiff') as src:
-    out_image, out_transform = rasterio.mask.mask(src, plantation.geometry, crop=False, nodata=-1)
-    out_meta = src.meta
-
-out_meta.update({"driver": "GTiff",
-                 "height": out_image.shape[1],
-                 "width": out_image.shape[2],
-                 "transform": out_transform})
-
-# reclassify crop classes back to forest class
-out_image[np.where(out_image > 0)] = 1000
-out_image[np.where(out_image == -1)] = 0
-with rasterio.open(path_data_inter / 'lc_change/deforested_92_16_plantantion.tiff', "w", **out_meta) as dest:
-    dest.write(out_image)
-
-# create binary change raster without modifying original classes
-for year in range(1992, 2020):
-    # input Raster
-    raster_old_path = [lc for lc in files_data_list if str(year) in str(lc)]
-
-    # open raster files
-    raster_old = gdal.Open(str(raster_old_path[0]))
-    raster_old_data = raster_old.GetRasterBand(1).ReadAsArray().astype(int)
-
-    # identify deforested areas
-    lc_mask = raster_old_data + out_image
-
-    # reclassify to forest classes
-    lc_mask[np.where(lc_mask >= 1000)] = 50
-
-    # add dimension in order to export
-    lc_mask = np.reshape(lc_mask, newshape=(1, raster_old.RasterYSize, raster_old.RasterXSize))
-    make_raster(in_ds=raster_old,
-                fn=str(path_data_inter / f'lc_change/lc_original_{str(year)}_masked.tiff'),
-                data=lc_mask,
-                data_type=gdal.GDT_Int16,
-                nr_bands=1,
-                nodata=None)
-
-    # logging info
-    logging.info(f"Done masking {str(year)}")
+# grid of the land cover change rasters
+with rasterio.open(files_deforest_list_sp[0]) as src:
+    grid_transform = src.transform
+
+# deforestation from 1992 - 2016 and deforested plantation pixels, streamed block by block
+if new_year is None or not path_plantation_mask.exists():
+    with stage('deforested_92_16'):
+        count(features=len(plantation))
+        stream_blocks(files_deforest_list_sp,
+                      {'deforested': path_data_inter / 'lc_change/deforested_92_16.tiff',
+                       'plantation': path_plantation_mask},
+                      deforested_92_16,
+                      memory_budget=memory_budget)
+
+# create masked land cover without modifying original classes, one year per worker
+if write_masked:
+    run_parallel(mask_year, incremental_years(catalog.rasters('lc', 'original'), new_year), workers=workers)
 
 # exporting ############################################################################################################
 
 # end time-count and print time stats ##################################################################################
-end_time = datetime.datetime.now()
-diff = end_time - start_time
-days, seconds = diff.days, diff.seconds
-hours = days * 24 + seconds // 3600
-minutes = (seconds % 3600) // 60
-seconds = seconds % 60
-logging.info(f'The entire process took {days} days, {hours} hours, {minutes} minutes {seconds} seconds')
+run.finish()
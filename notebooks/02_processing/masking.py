@@ -0,0 +1,73 @@
+# !/usr/bin/env python3
+
+# libraries ############################################################################################################
+import numpy as np
+import rasterio
+import blocks
+import instrument
+
+# global variables #####################################################################################################
+forest_class = 50
+
+# value of the deforested plantation pixels in the plantation mask written by mask_deforestation.py
+plantation_value = 1000
+
+
+# functions ############################################################################################################
+# land cover with the deforested plantation pixels set back to forest, keeps the dtype of the land cover
+def mask_plantation(lc, plantation_mask):
+    return np.where(plantation_mask >= plantation_value, forest_class, lc).astype(lc.dtype, copy=False)
+
+
+# an open land cover raster read through the plantation mask, behaves like the rasterio dataset of the land cover
+# (grid, profile, block shapes, ...) but every read also reads the same window of the mask and applies it
+class MaskedDataset:
+
+    def __init__(self, path, path_mask):
+        self.src = rasterio.open(path)
+        self.mask = rasterio.open(path_mask)
+        try:
+            blocks.check_grid([self.src, self.mask])
+        except ValueError:
+            self.close()
+            raise
+
+    def __getattr__(self, name):
+        return getattr(self.src, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def read(self, indexes=1, window=None):
+        data = self.src.read(indexes, window=window)
+        plantation = self.mask.read(1, window=window)
+        instrument.count(bytes_read=plantation.nbytes)
+        return mask_plantation(data, plantation)
+
+    def close(self):
+        self.src.close()
+        self.mask.close()
+
+
+# masked land cover of one year without a masked copy on disk: a land cover raster and the plantation mask, opened
+# by blocks.open_raster wherever a raster path is taken (stream_blocks, crop_years, build_cube, ...), picklable so it
+# can be handed to worker processes
+class MaskedView:
+
+    def __init__(self, path, path_mask):
+        self.path = path
+        self.path_mask = path_mask
+
+    def __repr__(self):
+        return f"MaskedView({str(self.path)!r}, {str(self.path_mask)!r})"
+
+    def open_dataset(self):
+        return MaskedDataset(self.path, self.path_mask)
+
+
+# masked views of yearly land cover rasters: {year: path} -> {year: MaskedView}
+def masked_views(rasters, path_mask):
+    return {year: MaskedView(path, path_mask) for year, path in rasters.items()}
@@ -0,0 +1,35 @@
+# !/usr/bin/env python3
+
+# libraries ############################################################################################################
+import numpy as np
+import pandas as pd
+
+
+# functions ############################################################################################################
+# moving-window sum of a 2d array over a size x size window (pixels beyond the edge count as 0), via an integral image
+def window_sum(data, size=3):
+    if size % 2 != 1:
+        raise ValueError(f"window size must be odd, got {size}")
+    r = size // 2
+    padded = np.pad(data.astype(np.int32), r)
+
+    integral = np.zeros((padded.shape[0] + 1, padded.shape[1] + 1), dtype=np.int32)
+    integral[1:, 1:] = padded.cumsum(axis=0).cumsum(axis=1)
+
+    return (integral[size:, size:] - integral[:-size, size:]
+            - integral[size:, :-size] + integral[:-size, :-size])
+
+
+# number of neighbouring pixels of every class in the size x size window around each sample pixel (centre excluded)
+# rows / cols are the pixel indices of the samples on the grid of data
+def neighbourhood_counts(data, rows, cols, classes, size=3):
+    rows = np.asarray(rows, dtype=np.intp)
+    cols = np.asarray(cols, dtype=np.intp)
+    centre = data[rows, cols]
+
+    counts = {}
+    for c in classes:
+        is_class = data == c
+        counts[str(c)] = window_sum(is_class, size)[rows, cols] - (centre == c)
+
+    return pd.DataFrame(counts)
@@ -0,0 +1,99 @@
+# !/usr/bin/env python3
+
+# libraries ############################################################################################################
+import pathlib
+import numpy as np
+import pandas as pd
+import shapely
+import geopandas as gpd
+import instrument
+
+# global variables #####################################################################################################
+polygon_types = ['Polygon', 'MultiPolygon']
+
+
+# functions ############################################################################################################
+# True if path exists and is not older than any of the sources (files or folders, e.g. a .gdb)
+def newer_than(path, sources):
+    path = pathlib.Path(path)
+    return path.exists() and all(path.stat().st_mtime >= pathlib.Path(source).stat().st_mtime for source in sources)
+
+
+# read only the features of a layer intersecting mask (GeoSeries / GeoDataFrame in any crs), the spatial filter is
+# applied by GDAL while reading (layer index first, then the exact geometry), so features elsewhere are never parsed
+# columns: attribute columns to read, crs: crs of the returned layer
+def read_within(path, mask, columns=None, crs=3116, **kwargs):
+    gdf = gpd.read_file(path, mask=mask, columns=columns, **kwargs)
+    instrument.count(features=len(gdf))
+    return gdf.to_crs(crs)
+
+
+# polygonal part of every geometry, lines and points of geometry collections (shared edges and corners) are dropped
+def polygonal(geoms):
+    geoms = np.asarray(geoms, dtype=object).copy()
+    collections = shapely.get_type_id(geoms) == 7
+    for i in np.flatnonzero(collections):
+        parts = [part for part in shapely.get_parts(geoms[i]) if part.geom_type in polygon_types]
+        geoms[i] = shapely.union_all(parts) if parts else shapely.Polygon()
+    keep = np.isin(shapely.get_type_id(geoms), [3, 6]) & ~shapely.is_empty(geoms)
+    return geoms, keep
+
+
+# intersection of two layers, the result of gpd.overlay(left, right, how='intersection') (same columns, duplicates
+# suffixed _1 / _2) without intersecting every pair of geometries:
+# candidate pairs come from the STRtree of right (exact intersects predicate), features lying within their zone (a
+# prepared geometry test) are kept as they are and only the features crossing a zone border are cut
+def intersect_layers(left, right, keep_geom_type=True):
+    left_idx, right_idx = right.sindex.query(left.geometry.values, predicate='intersects')
+    left_geoms = left.geometry.values[left_idx]
+    right_geoms = right.geometry.values[right_idx]
+
+    shapely.prepare(right_geoms)
+    within = shapely.contains_properly(right_geoms, left_geoms)
+    geoms = np.asarray(left_geoms, dtype=object).copy()
+    geoms[~within] = shapely.intersection(np.asarray(left_geoms[~within]), np.asarray(right_geoms[~within]))
+
+    if keep_geom_type:
+        geoms, keep = polygonal(geoms)
+    else:
+        keep = ~shapely.is_empty(geoms)
+    instrument.count(features=len(left_idx))
+
+    left_df = pd.DataFrame(left.drop(columns=left.geometry.name)).iloc[left_idx[keep]].reset_index(drop=True)
+    right_df = pd.DataFrame(right.drop(columns=right.geometry.name)).iloc[right_idx[keep]].reset_index(drop=True)
+    shared = left_df.columns.intersection(right_df.columns)
+    df = pd.concat([left_df.rename(columns={column: f'{column}_1' for column in shared}),
+                    right_df.rename(columns={column: f'{column}_2' for column in shared})], axis=1)
+    return gpd.GeoDataFrame(df, geometry=geoms[keep], crs=left.crs)
+
+
+# union of many polygons (a dissolve without attributes) as a spatially partitioned cascaded union: the geometries
+# are grouped into square cells of cell_size by their centre, every cell is unioned on its own and the (much simpler)
+# cell unions are unioned at the end, so no union ever holds more than one cell of raw geometries
+def partitioned_union(geoms, cell_size):
+    geoms = np.asarray(geoms, dtype=object)
+    geoms = geoms[~shapely.is_empty(geoms)]
+    if len(geoms) == 0:
+        return shapely.Polygon()
+
+    bounds = shapely.bounds(geoms)
+    centres = (bounds[:, :2] + bounds[:, 2:]) / 2
+    cells = np.floor((centres - centres.min(axis=0)) / cell_size).astype(np.int64)
+    _, cell_ids = np.unique(cells, axis=0, return_inverse=True)
+    cell_ids = cell_ids.ravel()
+
+    order = np.argsort(cell_ids, kind='stable')
+    splits = np.flatnonzero(np.diff(cell_ids[order])) + 1
+    cell_unions = [shapely.union_all(part) for part in np.split(geoms[order], splits)]
+    return shapely.union_all(cell_unions)
+
+
+# buffer of every geometry of several layers dissolved into single polygons, the buffered areas of the palm oil
+# plantations, cell_size defaults to 20 buffer distances
+# quad_segs as GeoSeries.buffer (resolution 16), shapely.buffer defaults to 8 and would change the buffered areas
+def buffer_union(layers, distance, cell_size=None, crs=None, quad_segs=16):
+    geoms = np.concatenate([layer.geometry.values for layer in layers])
+    buffered = shapely.buffer(np.asarray(geoms, dtype=object), distance, quad_segs=quad_segs)
+    union = partitioned_union(buffered, cell_size or 20 * distance)
+    parts = shapely.get_parts(union)
+    return gpd.GeoDataFrame(geometry=parts, crs=crs or layers[0].crs)
@@ -0,0 +1,52 @@
+# !/usr/bin/env python3
+
+# libraries ############################################################################################################
+import os
+import argparse
+import multiprocessing
+import concurrent.futures
+import numpy as np
+
+# global variables #####################################################################################################
+# base seed of the per-year random number generators
+seed = 2003
+
+
+# functions ############################################################################################################
+# number of worker processes from the --workers command line setting (0 means one per core)
+def parse_workers(default=1):
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--workers', type=int, default=default)
+    args, _ = parser.parse_known_args()
+    return os.cpu_count() if args.workers == 0 else max(args.workers, 1)
+
+
+# random number generator of one year, the same whichever process or order the year runs in
+def year_rng(year, base_seed=seed):
+    return np.random.default_rng([base_seed, year])
+
+
+# run func over independent tasks (usually years) and return the results in task order, so a parallel run gives
+# the same output as the serial one, workers=1 runs in process
+# the pool forks, the scripts have no __main__ guard and would be re-run by spawned workers
+def run_parallel(func, tasks, workers=1, initializer=None, initargs=()):
+    tasks = list(tasks)
+    if workers <= 1 or len(tasks) <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        return [func(task) for task in tasks]
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=min(workers, len(tasks)),
+                                                mp_context=multiprocessing.get_context('fork'),
+                                                initializer=initializer,
+                                                initargs=initargs) as executor:
+        return list(executor.map(func, tasks))
+
+
+# split sorted years into contiguous runs, one per worker, neighbouring runs share their boundary year so
+# year-to-year transitions are not lost
+def year_runs(years, workers):
+    years = sorted(years)
+    n_runs = max(1, min(workers, len(years) - 1))
+    bounds = np.linspace(0, len(years) - 1, n_runs + 1).round().astype(int)
+    return [years[a:b + 1] for a, b in zip(bounds[:-1], bounds[1:])]
@@ -0,0 +1,163 @@
+# !/usr/bin/env python3
+
+# libraries ############################################################################################################
+import ast
+import sys
+import json
+import logging
+import pathlib
+import hashlib
+import subprocess
+import collections
+import concurrent.futures
+
+# global variables #####################################################################################################
+# one pipeline script, inputs and outputs are paths or glob patterns relative to the repository root, a stage runs
+# after every stage that writes one of its inputs (same pattern string)
+Stage = collections.namedtuple('Stage', ['name', 'script', 'inputs', 'outputs'])
+
+# bytes read at once when hashing a file
+hash_chunk = 2 ** 20
+
+
+# functions ############################################################################################################
+# every file matching the patterns, sorted so the hash does not depend on the listing order
+def stage_files(root, patterns):
+    files = set()
+    for pattern in patterns:
+        # folders (zarr cubes, parquet datasets) stand for every file in them
+        for path in root.glob(pattern):
+            files.update([path] if path.is_file() else [p for p in path.rglob('*') if p.is_file()])
+    return sorted(files)
+
+
+# sha1 of a file's content, reused from the state while its size and mtime are unchanged
+def file_hash(path, known):
+    stat = path.stat()
+    key = str(path)
+    if key in known and known[key][:2] == [stat.st_size, stat.st_mtime_ns]:
+        return known[key][2]
+
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(hash_chunk), b''):
+            sha.update(chunk)
+    known[key] = [stat.st_size, stat.st_mtime_ns, sha.hexdigest()]
+    return known[key][2]
+
+
+# the script and the local modules it imports, recursively
+def local_modules(script):
+    script = pathlib.Path(script)
+    modules, todo = set(), [script]
+    while todo:
+        path = todo.pop()
+        if path in modules:
+            continue
+        modules.add(path)
+        for node in ast.walk(ast.parse(path.read_text())):
+            names = [alias.name for alias in node.names] if isinstance(node, ast.Import) else \
+                [node.module] if isinstance(node, ast.ImportFrom) and node.module else []
+            todo.extend(script.parent / f'{name}.py' for name in names if (script.parent / f'{name}.py').exists())
+    return sorted(modules)
+
+
+# hash of the code of a stage: the syntax tree of the script and its local modules, so parameters (buffers, year
+# ranges, class lists) are covered while comments and formatting are not
+def code_hash(script):
+    sha = hashlib.sha1()
+    for path in local_modules(script):
+        sha.update(path.name.encode())
+        sha.update(ast.dump(ast.parse(path.read_text())).encode())
+    return sha.hexdigest()
+
+
+# hash of everything a stage depends on, its code and the content of its input files
+def stage_hash(root, stage, known):
+    sha = hashlib.sha1(code_hash(root / stage.script).encode())
+    for path in stage_files(root, stage.inputs):
+        sha.update(str(path.relative_to(root)).encode())
+        sha.update(file_hash(path, known).encode())
+    return sha.hexdigest()
+
+
+# a stage is up to date when every output pattern matches and its hash is the one of its last successful run
+def up_to_date(root, stage, current, state):
+    outputs_exist = all(stage_files(root, [pattern]) for pattern in stage.outputs)
+    return outputs_exist and state['stages'].get(stage.name) == current
+
+
+# stages each stage waits for
+def dependencies(stages):
+    writers = {pattern: stage.name for stage in stages for pattern in stage.outputs}
+    return {stage.name: {writers[pattern] for pattern in stage.inputs if pattern in writers} - {stage.name}
+            for stage in stages}
+
+
+def load_state(path_state):
+    path_state = pathlib.Path(path_state)
+    if path_state.exists():
+        return json.loads(path_state.read_text())
+    return {'files': {}, 'stages': {}}
+
+
+def save_state(state, path_state):
+    path_state = pathlib.Path(path_state)
+    path_state.parent.mkdir(parents=True, exist_ok=True)
+    path_state.write_text(json.dumps(state, indent=1, sort_keys=True))
+
+
+def run_script(root, stage, args):
+    logging.info(f"Running {stage.name}")
+    subprocess.run([sys.executable, str(root / stage.script), *args], cwd=root, check=True)
+
+
+# run the stages in dependency order, stages whose hash is unchanged are skipped and independent stages run
+# concurrently (jobs at once), the hash of a stage is taken once its upstream stages are done so a re-run that
+# reproduces the same outputs does not invalidate the stages below it
+# force: names of stages to run regardless of their hash, dry_run only logs what would run
+def run_pipeline(root, stages, path_state, jobs=1, args=(), force=(), dry_run=False):
+    root = pathlib.Path(root)
+    stages = {stage.name: stage for stage in stages}
+    waits_for = dependencies(stages.values())
+    state = load_state(path_state)
+
+    done, ran = set(), []
+    running = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        while len(done) < len(stages):
+            n_done = len(done)
+            for name, stage in stages.items():
+                if name in done or name in running or not waits_for[name] <= done:
+                    continue
+
+                current = stage_hash(root, stage, state['files'])
+                stale = name in force or not up_to_date(root, stage, current, state)
+                # in a dry run the outputs of upstream stages that would run are not rewritten, so assume they change
+                stale = stale or dry_run and any(dep in ran for dep in waits_for[name])
+                if not stale:
+                    logging.info(f"{name} is up to date")
+                    done.add(name)
+                elif dry_run:
+                    logging.info(f"{name} would run")
+                    done.add(name)
+                    ran.append(name)
+                else:
+                    running[name] = (executor.submit(run_script, root, stage, args), current)
+
+            if not running:
+                if len(done) == n_done:
+                    raise ValueError(f"stages {sorted(set(stages) - done)} wait on each other")
+                continue
+
+            finished, _ = concurrent.futures.wait([future for future, _ in running.values()],
+                                                  return_when=concurrent.futures.FIRST_COMPLETED)
+            for name in [name for name, (future, _) in running.items() if future in finished]:
+                future, current = running.pop(name)
+                future.result()
+                state['stages'][name] = current
+                save_state(state, path_state)
+                done.add(name)
+                ran.append(name)
+
+    return ran
@@ -4,8 +4,8 @@
 # libraries ############################################################################################################
 import logging
 import pathlib
-import datetime
 import richdem as rd
+from instrument import start_run, stage
 
 # settings #############################################################################################################
 # set logging config
@@ -15,9 +15,8 @@ logging.basicConfig(level=logging.INFO,
                     # filename = 'tidy_data.log'
                     )
 
-# set time count
-start_time = datetime.datetime.now()
-logging.info("Starting process")
+# time, peak memory and io of every stage, logged and written to data/logs/<script>.jsonl
+run = start_run(__file__)
 
 # functions ############################################################################################################
 
@@ -46,20 +45,15 @@ path_dem = path_data_inter / 'dem/srtm_22_11_resample.tif'
 # global variables #####################################################################################################
 
 # process ##############################################################################################################
-dem = rd.LoadGDAL(str(path_dem))
-slope = rd.TerrainAttribute(dem, attrib='slope_riserun')
-aspect = rd.TerrainAttribute(dem, attrib='aspect')
-curvature = rd.TerrainAttribute(dem, attrib='curvature')
+with stage('terrain_attributes'):
+    dem = rd.LoadGDAL(str(path_dem))
+    slope = rd.TerrainAttribute(dem, attrib='slope_riserun')
+    aspect = rd.TerrainAttribute(dem, attrib='aspect')
+    curvature = rd.TerrainAttribute(dem, attrib='curvature')
 # exporting ############################################################################################################
 rd.SaveGDAL(str(path_data_inter/'dem/srtm_22_11_resample_slope.tif'), slope)
 rd.SaveGDAL(str(path_data_inter/'dem/srtm_22_11_resample_aspect.tif'), aspect)
 rd.SaveGDAL(str(path_data_inter/'dem/srtm_22_11_resample_curvature.tif'), curvature)
 
 # end time-count and print time stats ##################################################################################
-end_time = datetime.datetime.now()
-diff = end_time - start_time
-days, seconds = diff.days, diff.seconds
-hours = days * 24 + seconds // 3600
-minutes = (seconds % 3600) // 60
-seconds = seconds % 60
-logging.info(f'The entire process took {days} days, {hours} hours, {minutes} minutes {seconds} seconds')
+run.finish()
@@ -0,0 +1,74 @@
+# !/usr/bin/env python3
+
+# libraries ############################################################################################################
+import logging
+import numpy as np
+import pandas as pd
+import rasterio
+from rasterio.windows import Window
+import instrument
+
+
+# functions ############################################################################################################
+# pixel row / col of coordinates with the inverse affine transform, plus a mask of the points inside the raster
+def coords_to_pixels(x, y, transform, height, width):
+    inverse = ~transform
+    cols = np.floor(inverse.a * x + inverse.b * y + inverse.c).astype(np.int64)
+    rows = np.floor(inverse.d * x + inverse.e * y + inverse.f).astype(np.int64)
+    inside = (rows >= 0) & (rows < height) & (cols >= 0) & (cols < width)
+    return rows, cols, inside
+
+
+# predictor rasters sampled together at point coordinates
+# when every raster shares one grid the pixel indices are computed once for all bands, otherwise per raster
+class PredictorStack:
+
+    def __init__(self, paths):
+        self.paths = dict(paths)
+        self.grids = {}
+        for name, path in self.paths.items():
+            with rasterio.open(path) as src:
+                self.grids[name] = (src.transform, src.height, src.width, src.crs, src.nodata)
+
+        grids = {grid[:4] for grid in self.grids.values()}
+        self.aligned = len(grids) == 1
+        if not self.aligned:
+            logging.info("predictor rasters are not on one grid, sampling each raster on its own")
+
+    # points x predictors float32 matrix (raw values, as rasterio.sample returns them) and a matching nodata mask,
+    # points outside a raster get its nodata value (0 without one) and are flagged in the mask
+    def sample(self, x, y):
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        names = list(self.paths)
+
+        values = np.zeros((len(x), len(names)), dtype=np.float32)
+        nodata_mask = np.zeros((len(x), len(names)), dtype=bool)
+
+        pixels = None
+        for j, name in enumerate(names):
+            transform, height, width, _, nodata = self.grids[name]
+            if pixels is None or not self.aligned:
+                pixels = coords_to_pixels(x, y, transform, height, width)
+            rows, cols, inside = pixels
+
+            values[:, j] = nodata if nodata is not None else 0
+            nodata_mask[:, j] = ~inside
+            if inside.any():
+                band = self.read_window(name, rows[inside], cols[inside])
+                row_off, col_off = rows[inside].min(), cols[inside].min()
+                values[inside, j] = band[rows[inside] - row_off, cols[inside] - col_off]
+                if nodata is not None:
+                    is_nodata = np.isnan(values[:, j]) if np.isnan(nodata) else values[:, j] == np.float32(nodata)
+                    nodata_mask[:, j] |= is_nodata
+
+        return (pd.DataFrame(values, columns=names),
+                pd.DataFrame(nodata_mask, columns=names))
+
+    # only the window spanned by the sampled pixels is read
+    def read_window(self, name, rows, cols):
+        window = Window(cols.min(), rows.min(), cols.max() - cols.min() + 1, rows.max() - rows.min() + 1)
+        with rasterio.open(self.paths[name]) as src:
+            data = src.read(1, window=window)
+        instrument.count(bytes_read=data.nbytes)
+        return data
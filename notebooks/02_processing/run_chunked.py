@@ -0,0 +1,157 @@
+# !/usr/bin/env python3
+
+# libraries ############################################################################################################
+import logging
+import pathlib
+import rasterio
+from catalog import RasterCatalog
+from change import deforestation, reforestation
+from zonal import load_zone_labels
+from parallel import parse_workers
+from chunked import parse_scheduler, lazy_rasters, lazy_raster, lazy_change, lazy_masked, lazy_quality_check, \
+    lazy_zonal_stats, store_rasters, compare_rasters, compare_tables
+from landcover import composition, catchment_classes, study_area_classes, crop_groups
+from instrument import start_run, stage, count
+
+# settings #############################################################################################################
+# set logging config
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s %(levelname)-8s %(message)s',
+                    datefmt='%a, %d, %b, %Y, %H:%M:%S',
+                    # filename = 'tidy_data.log'
+                    )
+
+# time, peak memory and io of every stage, logged and written to data/logs/<script>.jsonl
+run = start_run(__file__)
+
+
+# functions ############################################################################################################
+# compare the rasters of the chunked run with the outputs of the scripts where those exist
+def validate(names):
+    for name in names:
+        differ = compare_rasters(path_chunked / name, path_lc_change / name)
+        if differ is None:
+            continue
+        if differ:
+            logging.warning(f"{name}: {differ:,} pixels differ from the output of the scripts")
+        else:
+            logging.info(f"{name}: same as the output of the scripts")
+
+
+# compare the tables of the chunked run with the tables of the scripts: {name: (table, path of the scripts' csv)}
+def validate_tables(tables):
+    for name, (df, path_reference) in tables.items():
+        differ = compare_tables(df, path_reference)
+        if differ is None:
+            continue
+        if differ:
+            logging.warning(f"{name}: {differ:,} values differ from {path_reference.name} of the scripts")
+        else:
+            logging.info(f"{name}: same as {path_reference.name} of the scripts")
+
+
+# folder path ##########################################################################################################
+path_current = pathlib.Path.cwd()
+path_src = path_current / 'src'
+path_notebooks = path_current / 'notebooks'
+path_data = path_current / 'data'
+path_data_raw = path_data / '01_raw'
+path_data_inter = path_data / '02_intermediate'
+path_data_output = path_data / '03_processed'
+
+# study areas
+path_catch = path_data_inter / 'study_area/catchments_SA.gpkg'
+path_study_area = path_data_inter / 'study_area/study_area.gpkg'
+
+# landcover
+path_landcover_92_19 = path_data_raw / 'LC_CCI_ESA_COL'
+
+# land cover change
+path_lc_change = path_data_inter / 'lc_change'
+
+# deforested plantation pixels, masked back to forest
+path_plantation_mask = path_lc_change / 'deforested_92_16_plantantion.tiff'
+
+# outputs of the chunked run, apart from the outputs of the scripts so both can be compared
+path_chunked = path_data_inter / 'chunked'
+
+# global variables #####################################################################################################
+# rasters indexed by product, variant and year, metadata cached between runs
+# the land cover of the run is the catalog's (the Colombia crop), catalog other rasters on the ESA grid (e.g. the full
+# extent) for other departments
+catalog = RasterCatalog([path_landcover_92_19, path_lc_change], path_data_inter / 'raster_catalog.json')
+
+# transitions of the quality checks
+quality_check_years = (2003, 2019)
+
+# also write the masked land cover of every year, as mask_deforestation.py with write_masked
+write_masked = False
+
+# number of threads / processes (--workers, 0 uses every core) and dask scheduler of the zonal counts (--scheduler)
+workers = parse_workers(default=0)
+scheduler = parse_scheduler()
+
+# process ##############################################################################################################
+path_chunked.mkdir(parents=True, exist_ok=True)
+
+rasters = catalog.rasters('lc', 'original')
+years = list(rasters)
+template = rasters[years[0]]
+with rasterio.open(template) as src:
+    nodata = src.nodata
+
+# every year as a lazy array of chunks, nothing is read until a result is computed
+lc = lazy_rasters(rasters)
+
+# de- and reforestation of consecutive years (deforestation.py)
+changes = lazy_change(lc, {'deforest': deforestation, 'reforest': reforestation})
+outputs = {f'landcover_change_{year_old}_{year_new}_{product}.tiff': data
+           for (year_old, year_new, product), data in changes.items()}
+
+# quality checks of the transitions (esa_lc_qualitycheck.py)
+first, last = quality_check_years
+checks = lazy_quality_check([data for (year_old, _, product), data in changes.items()
+                             if product == 'reforest' and first <= year_old <= last],
+                            [data for (year_old, _, product), data in changes.items()
+                             if product == 'deforest' and first <= year_old <= last])
+outputs.update({f'{name}_{str(first)[2:]}_{str(last)[2:]}.tiff': data for name, data in checks.items()})
+
+# land cover with deforested plantations masked back to forest (mask_deforestation.py)
+masked = lazy_masked(lc, lazy_raster(path_plantation_mask))
+if write_masked:
+    outputs.update({f'lc_original_{str(year)}_masked.tiff': data.astype('int16') for year, data in masked.items()})
+
+# change rasters, quality checks (and masked land cover) from one computation, every year is read once per chunk
+with stage('rasters', years=len(years)):
+    store_rasters(outputs, {name: path_chunked / name for name in outputs}, template, workers=workers)
+    count(bytes_written=sum(data.nbytes for data in outputs.values()))
+validate(outputs)
+
+# class counts of the land cover per catchment (main_lc.py) and of the masked land cover per study area polygon
+# (O1_zonal_stats.py, there from the rasters cropped to the study area, which keep the pixels inside the polygons)
+catchments = load_zone_labels(path_catch, template, path_data_inter / 'zones')
+study_area = load_zone_labels(path_study_area, template, path_data_inter / 'zones')
+with stage('zonal_counts', years=len(years)):
+    count(features=len(catchments[0]) + len(study_area[0]))
+    df_lc = lazy_zonal_stats(lc, {'catch': catchments}, nodata, scheduler=scheduler, workers=workers)['catch']
+    df_lc_masked = lazy_zonal_stats(masked, {'study_area': study_area}, scheduler=scheduler,
+                                    workers=workers)['study_area']
+
+# the land cover tables of the scripts: class counts (10 and 11 summarized), total pixel count and shares per
+# catchment as main_lc.py, class counts and shares per study area polygon as O1_zonal_stats.py
+df_lc = composition(df_lc, catchment_classes, groups=crop_groups, total='pixel_count')
+df_lc_masked = composition(df_lc_masked, study_area_classes, names='short')
+df_lc_masked.rename(columns={'unknown_share': 'outside_share'}, inplace=True)
+
+# main_lc.py joins its land cover columns with the re- and afforestation sources, compared on the columns both have
+validate_tables({'df_lc_catch.csv': (df_lc, path_data_inter / 'df_lc_reforest_catch.csv'),
+                 'df_lc.csv': (df_lc_masked, path_data_output / 'df_lc.csv')})
+
+# exporting ############################################################################################################
+with stage('export'):
+    count(rows=len(df_lc) + len(df_lc_masked))
+    df_lc.to_csv(path_chunked / 'df_lc_catch.csv')
+    df_lc_masked.to_csv(path_chunked / 'df_lc.csv')
+
+# end time-count and print time stats ##################################################################################
+run.finish()
@@ -0,0 +1,126 @@
+# !/usr/bin/env python3
+
+# libraries ############################################################################################################
+import logging
+import pathlib
+import argparse
+from pipeline import Stage, run_pipeline
+from instrument import start_run
+
+# settings #############################################################################################################
+# set logging config
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s %(levelname)-8s %(message)s',
+                    datefmt='%a, %d, %b, %Y, %H:%M:%S',
+                    # filename = 'tidy_data.log'
+                    )
+
+# time, peak memory and io of every stage, logged and written to data/logs/<script>.jsonl
+run = start_run(__file__)
+
+# folder path ##########################################################################################################
+# run from the repository root like every pipeline script, paths below are relative to it
+path_current = pathlib.Path.cwd()
+path_scripts = 'notebooks/02_processing'
+path_state = path_current / 'data' / '02_intermediate' / 'pipeline_state.json'
+
+# raw data
+raw_lc = ('data/01_raw/LC_CCI_ESA_COL/*v2.0.7.crop*', 'data/01_raw/LC_CCI_ESA_COL/*v2.1.1*')
+raw_admin = 'data/01_raw/admin_areas/col_second_level_admin_boundaries'
+raw_catch = 'data/01_raw/catchment_areas/hydrosheds-de3a202db76ddd93c689/hybas_sa_lev00_v1c'
+raw_dam = 'data/01_raw/dam_locations/GRanD_Version_1_3'
+raw_palm_rspo = 'data/01_raw/palm_oil/Agro-industry'
+raw_palm_planted = 'data/01_raw/palm_oil/plantations_v1_3_dl.gdb'
+raw_palm_mills = 'data/01_raw/palm_oil/Universal_Mill_List-shp'
+raw_oferta_ambiental = 'data/01_raw/igac/ofertas_ambiental.gpkg'
+raw_dis_pop = 'data/01_raw/access/2015_accessibility_to_cities_v1.0/2015_accessibility_to_cities_v1.0_crop_resamp.tif'
+
+# intermediate data made outside of the scripts below (gdalwarp resampling, hand-made study area layers)
+river = 'data/02_intermediate/rivers/rio_sogamoso.gpkg'
+munic = 'data/02_intermediate/study_area/municipalties_SA.gpkg'
+catch = 'data/02_intermediate/study_area/catchments_SA.gpkg'
+study_area_municipalities = 'data/02_intermediate/study_area/study_area_*_*.gpkg'
+dem = 'data/02_intermediate/dem/srtm_22_11_resample.tif'
+soil = 'data/02_intermediate/soil/*_crop_resample.tif'
+roads = 'data/02_intermediate/roads/*.gpkg'
+
+# outputs of the pipeline stages, a stage reading one of these runs after the stage writing it
+palm_study_area = 'data/02_intermediate/study_area/palm_*.gpkg'
+study_area = 'data/02_intermediate/study_area/study_area.gpkg'
+dem_terrain = 'data/02_intermediate/dem/srtm_22_11_resample_*.tif'
+lc_change = 'data/02_intermediate/lc_change/landcover_change_*_deforest.tiff'
+lc_change_reforest = 'data/02_intermediate/lc_change/landcover_change_*_reforest.tiff'
+deforested = 'data/02_intermediate/lc_change/deforested_92_16*.tiff'
+masked_cropped = 'data/02_intermediate/lc_change/lc_original_*_masked_cropped.tiff'
+masked_cropped_municipalities = 'data/02_intermediate/lc_change/lc_original_*_masked_cropped_*.tiff'
+reforest_masked = 'data/02_intermediate/lc_change/landcover_change_*_reforest_masked_copped.tiff'
+cube = 'data/02_intermediate/cube'
+sample_points = 'data/02_intermediate/sample_points/sample_points_v2.parquet'
+data_set = 'data/03_processed/sample_points/sample_points_0311.parquet'
+zonal_stats = 'data/03_processed/df_lc.csv'
+results_table = 'data/03_processed/O1_results_table_mun.csv'
+zonal_stats_catch = 'data/02_intermediate/df_lc_reforest*_catch.*'
+transitions_catch = 'data/02_intermediate/df_lc_transitions_catch.parquet'
+
+# global variables #####################################################################################################
+stages = [Stage('study_area', f'{path_scripts}/study_area.py',
+                [raw_admin, raw_catch, raw_dam, catch, river, raw_palm_rspo, raw_palm_planted],
+                [palm_study_area, study_area]),
+          Stage('predictor_dem', f'{path_scripts}/predictor_dem.py',
+                [dem],
+                [dem_terrain]),
+          Stage('deforestation', f'{path_scripts}/deforestation.py',
+                [*raw_lc],
+                [lc_change, lc_change_reforest]),
+          Stage('mask_deforestation', f'{path_scripts}/mask_deforestation.py',
+                [*raw_lc, lc_change, raw_palm_planted],
+                [deforested]),
+          Stage('crop_study_area', f'{path_scripts}/crop_study_area.py',
+                [*raw_lc, deforested, study_area, study_area_municipalities],
+                [masked_cropped, masked_cropped_municipalities]),
+          Stage('re_afforestation', f'{path_scripts}/re_afforestation.py',
+                [masked_cropped],
+                [reforest_masked]),
+          Stage('build_cube', f'{path_scripts}/build_cube.py',
+                [*raw_lc],
+                [cube]),
+          Stage('sample_points', f'{path_scripts}/sample_points.py',
+                [masked_cropped],
+                [sample_points]),
+          Stage('create_data', f'{path_scripts}/create_data.py',
+                [sample_points, masked_cropped, study_area, munic, river, raw_oferta_ambiental, raw_palm_mills, roads,
+                 dem, dem_terrain, soil, raw_dis_pop],
+                [data_set]),
+          Stage('O1_zonal_stats', f'{path_scripts}/O1_zonal_stats.py',
+                [masked_cropped, study_area],
+                [zonal_stats]),
+          Stage('O1_results_table_mun', f'{path_scripts}/O1_results_table_mun.py',
+                [reforest_masked, study_area, zonal_stats],
+                [results_table]),
+          Stage('main_lc', f'{path_scripts}/main_lc.py',
+                [*raw_lc, cube, catch],
+                [zonal_stats_catch, transitions_catch])]
+
+# command line: --jobs stages at once, --force stage names, --dry-run, --workers, --new-year and --trace-memory are
+# handed to every stage, stages with an incremental mode then only process the new year and extend their outputs
+parser = argparse.ArgumentParser(description='run the stages whose code or inputs changed')
+parser.add_argument('--jobs', type=int, default=1)
+parser.add_argument('--force', nargs='*', default=[])
+parser.add_argument('--dry-run', action='store_true')
+parser.add_argument('--workers', type=int, default=1)
+parser.add_argument('--new-year', type=int, default=None)
+parser.add_argument('--trace-memory', action='store_true')
+args = parser.parse_args()
+
+# process ##############################################################################################################
+ran = run_pipeline(path_current, stages, path_state,
+                   jobs=args.jobs,
+                   args=['--workers', str(args.workers)] + ([] if args.new_year is None else
+                                                            ['--new-year', str(args.new_year)])
+                        + (['--trace-memory'] if args.trace_memory else []),
+                   force=args.force,
+                   dry_run=args.dry_run)
+logging.info(f"Ran {len(ran)} of {len(stages)} stages: {', '.join(ran) if ran else 'none'}")
+
+# end time-count and print time stats ##################################################################################
+run.finish()
@@ -3,13 +3,19 @@
 # libraries ############################################################################################################
 import logging
 import pathlib
-import datetime
 import pandas as pd
 import geopandas as gpd
 import numpy as np
 import rasterio
 import rasterio.mask
-from osgeo import gdal
+from blocks import iter_blocks, window_where
+from parallel import parse_workers, run_parallel, year_rng
+from samples import build_samples, label_afforestation, plot_year_counts, write_plot_counts, read_plot_counts, \
+    extend_samples
+from years import parse_new_year
+from catalog import RasterCatalog
+from tables import read_dataset, write_dataset, compact_samples
+from instrument import start_run, stage, count
 
 # settings #############################################################################################################
 # set logging config
@@ -19,42 +25,42 @@ logging.basicConfig(level=logging.INFO,
                     # filename = 'tidy_data.log'
                     )
 
-# set time count
-start_time = datetime.datetime.now()
-logging.info("Starting process")
+# time, peak memory and io of every stage, logged and written to data/logs/<script>.jsonl
+run = start_run(__file__)
 
 
 # functions ############################################################################################################
-def get_files(patterns):
-    all_files = []
-    for pat in patterns:
-        all_files.extend(path_landcover_92_19.glob(pat))
-    return all_files
-
-
 def read_file(file):
     with rasterio.open(file) as src:
         return src.read(1)
 
 
-# https://stackoverflow.com/questions/53218931/how-to-unnest-explode-a-column-in-a-pandas-dataframe
-def unnesting(df, explode):
-    idx = df.index.repeat(df[explode[0]].str.len())
-    df1 = pd.concat([
-        pd.DataFrame({x: np.concatenate(df[x].values)}) for x in explode], axis=1)
-    df1.index = idx
+# sampled pixel indices (row, col) of every class in one year, drawn with the year's own random number generator
+def year_samples(year):
+    with stage('year_samples', year=year):
+        # collect pixel indices of each class block by block
+        inds_classes = {classy: [] for classy in classes}
+        for window, (year_lc_data,) in iter_blocks([catalog.get('lc', 'masked_cropped', year)],
+                                                   memory_budget=memory_budget):
+            # reclassify crop classes
+            year_lc_data[year_lc_data == 11] = 10
+            for classy in classes:
+                inds_classes[classy].append(np.transpose(window_where(year_lc_data == classy, window)))
 
-    return df1.join(df.drop(explode, 1), how='left')
+        rng = year_rng(year)
+        samples = []
+        for classy in classes:
+            inds = np.concatenate(inds_classes[classy])
 
+            samplesize = inds.shape[0]
 
-# https://stackoverflow.com/questions/52443906/pixel-array-position-to-lat-long-gdal-python
-def pixel2coord(x, y, raster):
-    xoff, a, b, yoff, d, e = raster.GetGeoTransform()
+            i = rng.choice(inds.shape[0], samplesize, replace=False)
+            samples.append(inds[i, :])
+            count(rows=samplesize)
 
-    xp = a * x + b * y + a * 0.5 + b * 0.5 + xoff
-    yp = d * x + e * y + d * 0.5 + e * 0.5 + yoff
-
-    return xp, yp
+    # logging info
+    logging.info(f"Done creating points for classes 10, 30, 40 in {str(year)}")
+    return samples
 
 
 # folder path ##########################################################################################################
@@ -75,156 +81,103 @@ path_study_area = path_data_inter / 'study_area/study_area.gpkg'
 # landcover
 path_landcover_92_19 = path_data_raw / 'LC_CCI_ESA_COL'
 # global variables #####################################################################################################
-file_format = '*.tif'
-pattern_data = ('*v2.0.7.crop*', '*v2.1.1*')
-pattern_qa = '*qualityflag*'
-pattern_reforest = '*reforest.tiff*'
-pattern_deforest = '*deforest.tiff*'
-pattern_mask = '*masked_cropped.tiff'
-
-files_all = path_landcover_92_19.glob(file_format)
-files_all_list = list(path_landcover_92_19.glob(file_format))
-
-files_data_list = get_files(pattern_data)
-files_data = (y for y in files_data_list)
+# rasters indexed by product, variant and year, metadata cached between runs
+catalog = RasterCatalog([path_landcover_92_19, path_data_inter / 'lc_change'], path_data_inter / 'raster_catalog.json')
 
-files_qa = path_data.glob(pattern_qa)
-files_qa_list = list(path_landcover_92_19.glob(pattern_qa))
+# bytes of raster data held at once
+memory_budget = 256 * 2 ** 20
 
-files_reforest_list = list((path_data_inter / 'lc_change').glob(pattern_reforest))
-files_reforest = (path_data_inter / 'lc_change').glob(pattern_reforest)
+# number of worker processes (--workers, 0 uses every core)
+workers = parse_workers()
 
-files_deforest_list = list((path_data_inter / 'lc_change').glob(pattern_deforest))
-files_deforest = (path_data_inter / 'lc_change').glob(pattern_deforest)
-
-files_mask_list = list((path_data_inter / 'lc_change').glob(pattern_mask))
-files_mask = (path_data_inter / 'lc_change').glob(pattern_mask)
-
-years = [str(i) for i in range(2004, 2020)]
-files_mask_list_sp = [s for s in files_mask_list if any(xs in str(s) for xs in years)]
-# process ##############################################################################################################
-# create empty data frame to store spectral information
-df = pd.DataFrame(columns={'lc': [],
-                           # 'Band01': [],
-                           # 'Band02': [],
-                           })
-
-# create empty data frame to store sample point information
-sample_p = pd.DataFrame(columns={'x': [],
-                                 'y': [],
-                                 'class': [],
-                                 'year': []})
+# year ingested incrementally (--new-year), only that year is sampled and appended to the existing points
+new_year = parse_new_year()
 
 classes = [10, 30, 40, 120, 50]
-for year in range(2003, 2020):
-
-    year_lc_path = [lc for lc in files_mask_list if str(year) in str(lc)]
-    # open raster files
-    year_lc = gdal.Open(str(year_lc_path[0]))
-
-    # read bands as matrix arrays
-    year_lc_data = year_lc.GetRasterBand(1).ReadAsArray().astype(int)
-
-    # get unique land cover classes and their counts
-    # unique, counts = np.unique(year_lc_data, return_counts=True)
-    # create dictionary from unique land cover classes and their counts
-    # lc_classes = dict(zip(unique, counts))
-
-    # reclassify crop classes
-    year_lc_data[np.where(year_lc_data == 11)] = 10
 
-    for classy in classes:
-        inds = np.transpose(np.where(year_lc_data == classy))
+# columns written by the filters below, dropped before the existing points are extended
+derived_columns = ['count', 'count_forest', 'plot_id', 'class_re', 'afforestation']
 
-        samplesize = inds.shape[0]
+# also write the GeoPackage and CSV copies (slow, for QGIS and spreadsheets)
+export_gpkg = False
 
-        i = np.random.choice(inds.shape[0], samplesize, replace=False)
-        indsselected = inds[i, :]
-        lc = year_lc_data[indsselected[:, 0], indsselected[:, 1]]
-
-        # store spectral information in data frame
-        df = df.append({'lc': lc,
-                        # 'Band06': pixel_v[5]
-                        # 'Band07': pixel_v[6],
-                        # 'Band08': pixel_v[7],
-                        # 'Band09': pixel_v[8],
-                        },
-                       ignore_index=True)
-
-        # store sample point information in data frame
-        sample_p = sample_p.append({'x': indsselected[:, 0],
-                                    'y': indsselected[:, 1],
-                                    'class': classy,
-                                    'year': year},
-                                   ignore_index=True)
-
-    # logging info
-    logging.info(f"Done creating points for classes 10, 30, 40 in {str(year)}")
-
-# unnest/explode spectral information within data frame
-df_samples = unnesting(df, ['lc'])
-
-# unnest/explode sample point information within data frame
-sample_points = unnesting(sample_p, ['x', 'y'])
-
-sample_points['x_coords'], sample_points['y_coords'] = pixel2coord(sample_points['y'], sample_points['x'], year_lc)
-sample_points_gdf = gpd.GeoDataFrame(sample_points,
-                                     geometry=gpd.points_from_xy(sample_points.x_coords, sample_points.y_coords))
-sample_points_gdf.set_crs(epsg=4326, inplace=True)
+# per pixel count of sampled years and forest years
+path_plot_counts = path_data_inter / 'sample_points/sample_points_v2_plot_counts.tiff'
+# process ##############################################################################################################
+# grid of the sampled rasters
+rasters_mask = catalog.rasters('lc', 'masked_cropped')
+with rasterio.open(next(iter(rasters_mask.values()))) as src:
+    grid_transform = src.transform
+    grid_shape = src.shape
+
+if new_year is None:
+    # sample every year on its own worker, results come back in year order
+    sample_years = list(catalog.rasters('lc', 'masked_cropped', first=2003))
+    with stage('sample_years', years=len(sample_years)):
+        samples_by_year = dict(zip(sample_years, run_parallel(year_samples, sample_years, workers=workers)))
+
+    # write pixel row / col, class and year into typed columns and convert to coordinates in one step
+    with stage('build_samples'):
+        sample_points_gdf = build_samples(samples_by_year, classes, grid_transform, crs='EPSG:4326')
+        count(rows=len(sample_points_gdf))
+    del samples_by_year
+
+    plot_counts = plot_year_counts(sample_points_gdf, grid_shape)
+else:
+    # sample only the new year and extend the existing points and plot counts with it
+    n_years_before, n_forest_before, years_before = read_plot_counts(path_plot_counts)
+    if new_year in years_before:
+        raise ValueError(f"{new_year} is already sampled")
+    sample_years = years_before + [new_year]
+
+    new_points = build_samples({new_year: year_samples(new_year)}, classes, grid_transform, crs='EPSG:4326')
+    n_years_new, n_forest_new = plot_year_counts(new_points, grid_shape)
+    plot_counts = (n_years_before + n_years_new, n_forest_before + n_forest_new)
+
+    sample_points_gdf = read_dataset(path_data_inter / "sample_points/sample_points_v2.parquet")
+    sample_points_gdf['class'] = sample_points_gdf['class'].astype(np.int16)
+    sample_points_gdf = extend_samples(sample_points_gdf.drop(columns=derived_columns), new_points, n_forest_before,
+                                       years_before, classes, grid_transform, crs='EPSG:4326')
+    del new_points
 
 # sample_points_gdf.to_file(path_data_inter / "sample_points/sample_points_first_draft.gpkg", driver="GPKG")
 
 # get afforestation info
 sample_points_gdf['count'] = sample_points_gdf.groupby(['x', 'y'])['x'].transform('size')
-sample_points_gdf['year'] = sample_points_gdf['year'].astype(int)
 
 # remove plots which inlcude other classes
-sample_points_gdf = sample_points_gdf[(sample_points_gdf['count'] == 17)]
+sample_points_gdf = sample_points_gdf[(sample_points_gdf['count'] == len(sample_years))]
 
 # remove plots which are only forest
 mask = (sample_points_gdf['class'] == 50)
 sample_points_gdf_valid = sample_points_gdf[(sample_points_gdf['class'] == 50)]
 sample_points_gdf.loc[mask, 'count_forest'] = sample_points_gdf_valid.groupby(['x', 'y'])['class'].transform('count')
-sample_points_gdf = sample_points_gdf[(sample_points_gdf['count_forest'] != 17)]
+sample_points_gdf = sample_points_gdf[(sample_points_gdf['count_forest'] != len(sample_years))]
 
 # add plot id
 sample_points_gdf['plot_id'] = sample_points_gdf.groupby(['x', 'y']).ngroup().add(1)
 
-# get plot id where there is forest at some point in time
-plot_candidates = sample_points_gdf.loc[sample_points_gdf['count_forest'] >= 1]['plot_id'].unique()
-
 # change forest values so it becomes the biggest
 sample_points_gdf['class_re'] = sample_points_gdf['class'].map({50: 5000, 10: 1, 30: 1, 40: 1, 120: 1})
-sample_points_gdf['afforestation'] = 0
 sample_points_gdf.reset_index(drop=True, inplace=True)
 
-dn = []
-for plot_id in plot_candidates:
-    mask = sample_points_gdf['plot_id'] == plot_id
-    plots_valid = sample_points_gdf[(sample_points_gdf['plot_id'] == plot_id)]
-    plots_valid['diff'] = plots_valid['class_re'].diff()
+# flag the year before the first non-forest -> forest transition of every plot
+sample_points_gdf['afforestation'] = label_afforestation(sample_points_gdf)
 
-    year_afforestation = plots_valid[(plots_valid['diff'] > 0)]['year']
-
-    if year_afforestation.size == 0:
-        continue
-    else:
-        year_afforestation = year_afforestation.values[0] - 1
-        ids = sample_points_gdf.loc[mask].year == year_afforestation
-        ids = ids[ids].index.values[0]
-        dn.append(ids)
-
-sample_points_gdf.loc[dn, 'afforestation'] = 1
+# small integer, categorical and float32 columns, the table is copied and joined many times in create_data.py
+compact_samples(sample_points_gdf)
 
 # exporting ############################################################################################################
-sample_points_gdf.to_file(path_data_inter / "sample_points/sample_points_v2.gpkg", driver="GPKG")
-sample_points_gdf.to_csv(path_data_inter / "sample_points/sample_points_v2.csv")
+# year partitioned GeoParquet, read by create_data.py
+with stage('export'):
+    count(rows=len(sample_points_gdf))
+    write_dataset(sample_points_gdf, path_data_inter / "sample_points/sample_points_v2.parquet")
+    if export_gpkg:
+        sample_points_gdf.to_file(path_data_inter / "sample_points/sample_points_v2.gpkg", driver="GPKG")
+        sample_points_gdf.to_csv(path_data_inter / "sample_points/sample_points_v2.csv")
+
+with rasterio.open(next(iter(rasters_mask.values()))) as src:
+    write_plot_counts(path_plot_counts, *plot_counts, sample_years, src)
 
 # end time-count and print time stats ##################################################################################
-end_time = datetime.datetime.now()
-diff = end_time - start_time
-days, seconds = diff.days, diff.seconds
-hours = days * 24 + seconds // 3600
-minutes = (seconds % 3600) // 60
-seconds = seconds % 60
-logging.info(f'The entire process took {days} days, {hours} hours, {minutes} minutes {seconds} seconds')
+run.finish()
@@ -0,0 +1,118 @@
+# !/usr/bin/env python3
+
+# libraries ############################################################################################################
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import rasterio
+import blocks
+
+
+# functions ############################################################################################################
+# x / y coordinates of pixel centres for arrays of rows and cols, one vectorized affine transform
+def pixel_centres(rows, cols, transform):
+    cols = np.asarray(cols) + 0.5
+    rows = np.asarray(rows) + 0.5
+    x_coords = transform.c + cols * transform.a + rows * transform.b
+    y_coords = transform.f + cols * transform.d + rows * transform.e
+    return x_coords, y_coords
+
+
+# sample point GeoDataFrame from the sampled pixel indices of every year and class
+# year_samples: {year: [inds of classes[0], inds of classes[1], ...]}, inds are (n, 2) arrays of row / col
+# x holds the pixel row and y the pixel column, x_coords / y_coords the pixel centre
+def build_samples(year_samples, classes, transform, crs='EPSG:4326'):
+    n_points = sum(len(inds) for samples in year_samples.values() for inds in samples)
+
+    rows = np.empty(n_points, dtype=np.int32)
+    cols = np.empty(n_points, dtype=np.int32)
+    lc_class = np.empty(n_points, dtype=np.int16)
+    year = np.empty(n_points, dtype=np.int16)
+
+    start = 0
+    for sample_year, samples in year_samples.items():
+        for classy, inds in zip(classes, samples):
+            end = start + len(inds)
+            rows[start:end] = inds[:, 0]
+            cols[start:end] = inds[:, 1]
+            lc_class[start:end] = classy
+            year[start:end] = sample_year
+            start = end
+
+    x_coords, y_coords = pixel_centres(rows, cols, transform)
+
+    return gpd.GeoDataFrame({'x': rows,
+                             'y': cols,
+                             'class': lc_class,
+                             'year': year,
+                             'x_coords': x_coords,
+                             'y_coords': y_coords},
+                            geometry=gpd.points_from_xy(x_coords, y_coords),
+                            crs=crs)
+
+
+# flag the year before each plot's first non-forest -> forest transition (afforestation = 1), computed on a dense
+# plot x year matrix, plots need one row per year (the complete-series filter)
+def label_afforestation(df, forest_class=50):
+    plots, plot_idx = np.unique(df['plot_id'].values, return_inverse=True)
+    years, year_idx = np.unique(df['year'].values, return_inverse=True)
+
+    row_of = np.full((len(plots), len(years)), -1, dtype=np.int64)
+    row_of[plot_idx, year_idx] = np.arange(len(df))
+    if (row_of < 0).any():
+        raise ValueError("every plot needs one row per year to label afforestation")
+
+    forest = np.zeros(row_of.shape, dtype=bool)
+    forest[plot_idx, year_idx] = df['class'].values == forest_class
+
+    # first year in which a plot turns from non-forest to forest, the flag goes to the year before
+    gain = forest[:, 1:] & ~forest[:, :-1]
+    has_gain = gain.any(axis=1)
+    first_gain = gain.argmax(axis=1)
+
+    afforestation = np.zeros(len(df), dtype=np.int8)
+    afforestation[row_of[has_gain, first_gain[has_gain]]] = 1
+    return afforestation
+
+
+# per pixel number of sampled years and of forest years, the state the complete-series filters are updated from
+def plot_year_counts(df, shape, forest_class=50):
+    flat = df['x'].values.astype(np.int64) * shape[1] + df['y'].values
+    n_years = np.bincount(flat, minlength=shape[0] * shape[1]).reshape(shape)
+    n_forest = np.bincount(flat[df['class'].values == forest_class], minlength=shape[0] * shape[1]).reshape(shape)
+    return n_years.astype(np.uint8), n_forest.astype(np.uint8)
+
+
+# store the plot year counts with the sampled years as a two band raster on the grid of the sampled rasters
+def write_plot_counts(path, n_years, n_forest, years, src):
+    profile = blocks.raster_profile(src, dtype='uint8')
+    profile['count'] = 2
+    with rasterio.open(path, 'w', **profile) as dst:
+        dst.write(n_years, 1)
+        dst.write(n_forest, 2)
+        dst.update_tags(years=','.join(str(year) for year in years))
+
+
+# plot year counts and sampled years written by write_plot_counts
+def read_plot_counts(path):
+    with rasterio.open(path) as src:
+        return src.read(1), src.read(2), [int(year) for year in src.tags()['years'].split(',')]
+
+
+# sample point rows extended by the points of a new year, plots that were forest in every earlier year were removed
+# by the only-forest filter, when they leave forest in the new year their forest rows of the earlier years come back
+# the complete-series and only-forest filters have to be applied to the result again
+def extend_samples(df, new_points, n_forest_before, years_before, classes, transform, forest_class=50,
+                   crs='EPSG:4326'):
+    rows, cols = new_points['x'].values, new_points['y'].values
+    was_forest = n_forest_before[rows, cols] == len(years_before)
+    left_forest = new_points.loc[was_forest & (new_points['class'].values != forest_class)]
+
+    inds = np.column_stack([left_forest['x'].values, left_forest['y'].values]).astype(np.int32)
+    empty = np.empty((0, 2), dtype=np.int32)
+    forest_rows = build_samples({year: [inds if classy == forest_class else empty for classy in classes]
+                                 for year in years_before},
+                                classes, transform, crs=crs)
+
+    extended = pd.concat([df, forest_rows, new_points], ignore_index=True)
+    return extended.sort_values('year', kind='stable').reset_index(drop=True)
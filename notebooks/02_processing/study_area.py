@@ -3,8 +3,9 @@
 # libraries ############################################################################################################
 import logging
 import pathlib
-import datetime
 import geopandas as gpd
+from overlay import newer_than, read_within, intersect_layers, buffer_union
+from instrument import start_run, stage
 
 # settings #############################################################################################################
 # set logging config
@@ -14,9 +15,8 @@ logging.basicConfig(level=logging.INFO,
                     # filename = 'tidy_data.log'
                     )
 
-# set time count
-start_time = datetime.datetime.now()
-logging.info("starting process")
+# time, peak memory and io of every stage, logged and written to data/logs/<script>.jsonl
+run = start_run(__file__)
 
 
 # functions ############################################################################################################
@@ -37,6 +37,16 @@ path_river = path_data_inter / 'rivers' / 'rio_sogamoso.gpkg'
 path_palm_rspo = path_data_raw / 'palm_oil' / 'Agro-industry' / 'Agro-industry.shp'
 path_palm_planted = path_data_raw / 'palm_oil' / 'plantations_v1_3_dl.gdb'
 
+# catchments of the dam clipped with the municipalities
+path_dam_catch = path_data_inter / 'study_area' / 'catchments_SA.gpkg'
+
+# palm oil plantations clipped with the municipalities / the catchments and their dissolved buffer, reused while they
+# are newer than their inputs, so only the river steps run for a new river or river buffer distance
+path_palm_rspo_mun = path_data_inter / 'study_area' / 'palm_rspo_mun.gpkg'
+path_palm_rspo_SA = path_data_inter / 'study_area' / 'palm_rspo_SA.gpkg'
+path_palm_planted_mun = path_data_inter / 'study_area' / 'palm_planted_mun.gpkg'
+path_palm_planted_SA = path_data_inter / 'study_area' / 'palm_planted_SA.gpkg'
+
 # global variables #####################################################################################################
 # admin areas
 department_dic = {'Santander': 68}
@@ -49,75 +59,88 @@ municipaltiy_dic = {'Puerto Wilches': '68575',
 municipaltiy_ids = ['68575', '68655', '68081']
 
 palm_oil_buffer = 2500
+river_buffer = 25000
+
+# dissolved palm oil buffer of the catchments
+path_palm_buffer = path_data_inter / 'study_area' / f'palm_oil_SA_{palm_oil_buffer}.gpkg'
+
+# columns of the palm oil layers
+palm_rspo_cols = ['Group_', 'Company', 'Plantation', 'RSPOCert', 'MemberYear', 'GlobalID']
+palm_planted_cols = ['org_name', 'common_name', 'plant_ag', 'size', 'ownership', 'year']
 
 # load data ############################################################################################################
-# admin areas
+# admin areas, only the municipalities are read
 logging.info("loading admin area data")
-admin_a = gpd.read_file(path_admin)
-admin_a.to_crs(epsg=3116, inplace=True)
+with stage('load_admin'):
+    municipalties = gpd.read_file(path_admin, where=f"MPIO_CCDGO IN ({', '.join(map(repr, municipaltiy_ids))})")
+    municipalties.to_crs(epsg=3116, inplace=True)
+
+# catchments of the dam
+logging.info("loading catchment data")
+dam_catch = gpd.read_file(path_dam_catch)
+dam_catch.to_crs(epsg=3116, inplace=True)
 
 # river
 logging.info("loading river data")
 river = gpd.read_file(path_river)
 river.to_crs(epsg=3116, inplace=True)
 
-# rspo palm oil plantatiosn
-logging.info("loading rspo palm oil plantations")
-palm_rspo = gpd.read_file(path_palm_rspo)
-palm_rspo.to_crs(epsg=3116, inplace=True)
-
-# planted trees
-logging.info("loading planted trees")
-palm_planted = gpd.read_file(path_palm_planted, driver='FileGDB', layer='col_plant')
-palm_planted.to_crs(epsg=3116, inplace=True)
-
 # process ##############################################################################################################
-# filter municipalities
-logging.info("filter municipalities")
-municipalties = admin_a[admin_a['MPIO_CCDGO'].isin(municipaltiy_ids)]
-del admin_a
-
-# select palm oil columns
-palm_rspo = palm_rspo[['Group_', 'Company', 'Plantation', 'RSPOCert', 'MemberYear', 'GlobalID', 'geometry']]
-palm_planted = palm_planted[['org_name', 'common_name', 'plant_ag', 'size', 'ownership', 'year', 'geometry']]
-
-# clip rspo palm oil areas with municipalities
-logging.info("clip palm oil data  with municipalities")
-palm_rspo_mun = gpd.overlay(palm_rspo, municipalties[['MPIO_CNM_1', 'geometry']], how='intersection')
-palm_rspo_SA = gpd.overlay(palm_rspo, dam_catch[['MPIO_CNM_1', 'geometry']], how='intersection')
-palm_rspo_mun.to_crs(epsg=3116, inplace=True)
-palm_rspo_SA.to_crs(epsg=3116, inplace=True)
-palm_rspo_mun.to_file(path_data_inter / "study_area/palm_rspo_mun.gpkg", driver="GPKG")
-palm_rspo_SA.to_file(path_data_inter / "study_area/palm_rspo_SA.gpkg", driver="GPKG")
-del palm_rspo
-
-palm_planted_mun = gpd.overlay(palm_planted, municipalties[['MPIO_CNM_1', 'geometry']], how='intersection')
-palm_planted_SA = gpd.overlay(palm_planted, dam_catch[['MPIO_CNM_1', 'geometry']], how='intersection')
-palm_planted_mun.to_crs(epsg=3116, inplace=True)
-palm_planted_SA.to_crs(epsg=3116, inplace=True)
-palm_planted_mun.to_file(path_data_inter / "study_area/palm_planted_mun.gpkg", driver="GPKG")
-palm_planted_SA.to_file(path_data_inter / "study_area/palm_planted_SA.gpkg", driver="GPKG")
-del palm_planted
-df.groupby(['Name', 'Fruit'])['Number'].agg('sum')
-# combine palm oil data
-palm_oil_SA = gpd.overlay(palm_rspo_SA, palm_planted_SA, how='union')
+palm_sources = [path_admin, path_dam_catch, path_palm_rspo, path_palm_planted]
+palm_outputs = [path_palm_rspo_mun, path_palm_rspo_SA, path_palm_planted_mun, path_palm_planted_SA]
+if all(newer_than(path, palm_sources) for path in palm_outputs):
+    logging.info("loading palm oil data clipped with municipalities and catchments")
+    palm_rspo_SA = gpd.read_file(path_palm_rspo_SA)
+    palm_planted_SA = gpd.read_file(path_palm_planted_SA)
+else:
+    # only plantations intersecting the municipalities or the catchments are read
+    extent = gpd.GeoSeries(list(municipalties.geometry) + list(dam_catch.geometry), crs=municipalties.crs)
+
+    # rspo palm oil plantatiosn
+    logging.info("loading rspo palm oil plantations")
+    with stage('load_palm_rspo'):
+        palm_rspo = read_within(path_palm_rspo, extent, columns=palm_rspo_cols)
+
+    # planted trees
+    logging.info("loading planted trees")
+    with stage('load_palm_planted'):
+        palm_planted = read_within(path_palm_planted, extent, columns=palm_planted_cols, layer='col_plant')
+
+    # clip palm oil areas with municipalities and catchments
+    logging.info("clip palm oil data  with municipalities")
+    with stage('clip_palm_oil'):
+        palm_rspo_mun = intersect_layers(palm_rspo, municipalties[['MPIO_CNM_1', 'geometry']])
+        palm_rspo_SA = intersect_layers(palm_rspo, dam_catch[['MPIO_CNM_1', 'geometry']])
+        palm_planted_mun = intersect_layers(palm_planted, municipalties[['MPIO_CNM_1', 'geometry']])
+        palm_planted_SA = intersect_layers(palm_planted, dam_catch[['MPIO_CNM_1', 'geometry']])
+    del palm_rspo, palm_planted
+
+    palm_rspo_mun.to_file(path_palm_rspo_mun, driver="GPKG")
+    palm_rspo_SA.to_file(path_palm_rspo_SA, driver="GPKG")
+    palm_planted_mun.to_file(path_palm_planted_mun, driver="GPKG")
+    palm_planted_SA.to_file(path_palm_planted_SA, driver="GPKG")
+    del palm_rspo_mun, palm_planted_mun
+
+# combine palm oil data, buffer it with 2500 meters and dissolve the buffers
+if newer_than(path_palm_buffer, [path_palm_rspo_SA, path_palm_planted_SA]):
+    palm_oil_SA_2500 = gpd.read_file(path_palm_buffer)
+else:
+    logging.info(f"buffer palm oil data with {palm_oil_buffer} meters")
+    with stage('buffer_palm_oil'):
+        palm_oil_SA_2500 = buffer_union([palm_rspo_SA, palm_planted_SA], palm_oil_buffer)
+    palm_oil_SA_2500.to_file(path_palm_buffer, driver="GPKG")
 del palm_rspo_SA, palm_planted_SA
 
-# buffer palm oil data with 2500 meters
-palm_oil_SA_2500 = gpd.GeoDataFrame(palm_oil_SA.geometry.buffer(palm_oil_buffer)).rename(columns={0: 'geometry'}).set_geometry(
-    'geometry')
-palm_oil_SA_2500 = palm_oil_SA_2500.dissolve()
-palm_oil_SA_2500 = palm_oil_SA_2500.explode()
-palm_oil_SA_2500.reset_index(inplace=True, drop=True)
-
 logging.info("create 25km buffer around river and clip with municiplaities")
-river_25000 = gpd.GeoDataFrame(river.geometry.buffer(25000)).rename(columns={0: 'geometry'}).set_geometry('geometry')
-river_buffered = gpd.overlay(river_25000, municipalties, how='intersection')
+with stage('river_buffer'):
+    river_25000 = gpd.GeoDataFrame(geometry=river.geometry.buffer(river_buffer), crs=river.crs)
+    river_buffered = intersect_layers(river_25000, municipalties)
 
 # clip river buffer with palm oil areas
-study_area = gpd.overlay(river_buffered, palm_oil_SA_2500, how='intersection', keep_geom_type=False)
-study_area = study_area.explode()
-study_area.reset_index(inplace=True, drop=True)
+with stage('study_area'):
+    study_area = intersect_layers(river_buffered, palm_oil_SA_2500, keep_geom_type=False)
+    study_area = study_area.explode()
+    study_area.reset_index(inplace=True, drop=True)
 
 # select only the biggest polygons
 mask = study_area.area / 1000000 > 100  # metres squared
@@ -136,10 +159,4 @@ study_area = study_area[study_area.columns[~study_area.columns.isin(useless_cols
 study_area.to_file(path_data_inter / "study_area/study_area.gpkg", driver="GPKG")
 
 # end time-count and print time stats ##################################################################################
-end_time = datetime.datetime.now()
-diff = end_time - start_time
-days, seconds = diff.days, diff.seconds
-hours = days * 24 + seconds // 3600
-minutes = (seconds % 3600) // 60
-seconds = seconds % 60
-logging.info(f'The entire process took {days} days, {hours} hours, {minutes} minutes {seconds} seconds')
+run.finish()
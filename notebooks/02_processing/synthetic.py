@@ -0,0 +1,109 @@
+# !/usr/bin/env python3
+
+# libraries ############################################################################################################
+import numpy as np
+import geopandas as gpd
+import rasterio
+from rasterio.transform import from_origin
+from shapely.geometry import LineString, MultiPoint, box
+from shapely.ops import voronoi_diagram
+
+# global variables #####################################################################################################
+# ESA CCI like class shares of the study area (crop 10 / 11, mosaic 30 / 40, forest 50, shrubland 120)
+class_mix = {10: 0.25, 11: 0.05, 30: 0.15, 40: 0.15, 50: 0.3, 120: 0.1}
+
+# upper left corner (lon, lat) and pixel size (degrees, ~300 m) of the synthetic grids, around the study area
+origin = (-74.2, 7.8)
+pixel_size = 1 / 360
+
+
+# functions ############################################################################################################
+# transform of the synthetic grids
+def synthetic_transform(pixel_size=pixel_size):
+    return from_origin(origin[0], origin[1], pixel_size, pixel_size)
+
+
+# lon / lat bounds (minx, miny, maxx, maxy) of a synthetic grid
+def synthetic_bounds(size, pixel_size=pixel_size):
+    return origin[0], origin[1] - size * pixel_size, origin[0] + size * pixel_size, origin[1]
+
+
+# write one band on a synthetic grid with the creation options of the pipeline rasters
+def write_synthetic(path, data, transform, nodata=None):
+    profile = {'driver': 'GTiff',
+               'width': data.shape[1],
+               'height': data.shape[0],
+               'count': 1,
+               'dtype': data.dtype.name,
+               'crs': 'EPSG:4326',
+               'transform': transform,
+               'nodata': nodata,
+               'compress': 'deflate',
+               'predictor': 2,
+               'tiled': True,
+               'blockxsize': 256,
+               'blockysize': 256}
+    with rasterio.open(path, 'w', **profile) as dst:
+        dst.write(data, 1)
+    return path
+
+
+# land cover of the first year: patches of patch x patch pixels drawn from the class mix
+def synthetic_classes(size, rng, class_mix=class_mix, patch=8):
+    classes = np.array(list(class_mix), dtype=np.uint8)
+    shares = np.array(list(class_mix.values()), dtype=np.float64)
+    n_patches = -(-size // patch)
+    patches = rng.choice(classes, size=(n_patches, n_patches), p=shares / shares.sum())
+    return np.repeat(np.repeat(patches, patch, axis=0), patch, axis=1)[:size, :size]
+
+
+# yearly ESA CCI like land cover rasters (uint8), every year change_rate of the pixels get a new class drawn from the
+# class mix, returns {year: path}
+def synthetic_landcover(folder, size, years, class_mix=class_mix, change_rate=0.02, seed=0):
+    rng = np.random.default_rng(seed)
+    transform = synthetic_transform()
+    classes = np.array(list(class_mix), dtype=np.uint8)
+    shares = np.array(list(class_mix.values()), dtype=np.float64)
+
+    data = synthetic_classes(size, rng, class_mix)
+    rasters = {}
+    for year in years:
+        if rasters:
+            changed = rng.random(data.shape) < change_rate
+            data[changed] = rng.choice(classes, size=int(changed.sum()), p=shares / shares.sum())
+        rasters[year] = write_synthetic(folder / f'lc_synthetic_{year}.tiff', data, transform)
+    return rasters
+
+
+# smooth float32 predictor raster (e.g. altitude or a soil property) on the synthetic grid
+def synthetic_predictor(path, size, seed=0, scale=1000.0):
+    rng = np.random.default_rng(seed)
+    rows, cols = np.ogrid[:size, :size]
+    phase = rng.random(2) * 2 * np.pi
+    data = (np.sin(rows / size * 4 * np.pi + phase[0]) + np.cos(cols / size * 4 * np.pi + phase[1])) * scale / 2
+    data = (data + rng.normal(0, scale / 50, size=(size, size))).astype(np.float32)
+    return write_synthetic(path, data, synthetic_transform(), nodata=-9999.0)
+
+
+# zone polygons tiling the grid (Voronoi cells of random seeds) with a name column, stand-ins for the municipalities
+# and catchments
+def synthetic_zones(size, n_zones, seed=0, name='zone'):
+    rng = np.random.default_rng(seed)
+    minx, miny, maxx, maxy = synthetic_bounds(size)
+    seeds = MultiPoint(np.column_stack([rng.uniform(minx, maxx, n_zones), rng.uniform(miny, maxy, n_zones)]))
+    extent = box(minx, miny, maxx, maxy)
+    cells = [cell.intersection(extent) for cell in voronoi_diagram(seeds, envelope=extent).geoms]
+    return gpd.GeoDataFrame({name: [f'{name}_{i}' for i in range(len(cells))]}, geometry=cells, crs='EPSG:4326')
+
+
+# random walk lines (roads / rivers) of n_vertices vertices each over the grid
+def synthetic_lines(size, n_lines, n_vertices=50, seed=0):
+    rng = np.random.default_rng(seed)
+    minx, miny, maxx, maxy = synthetic_bounds(size)
+    step = (maxx - minx) / n_vertices
+    lines = []
+    for _ in range(n_lines):
+        start = rng.uniform([minx, miny], [maxx, maxy])
+        walk = start + np.cumsum(rng.normal(0, step, size=(n_vertices, 2)), axis=0)
+        lines.append(LineString(np.clip(walk, [minx, miny], [maxx, maxy])))
+    return gpd.GeoDataFrame(geometry=lines, crs='EPSG:4326')
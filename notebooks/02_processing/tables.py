@@ -0,0 +1,123 @@
+# !/usr/bin/env python3
+
+# libraries ############################################################################################################
+import shutil
+import logging
+import pathlib
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from landcover import registry
+
+# global variables #####################################################################################################
+# integer columns of the sample point tables and their dtypes
+sample_dtypes = {'year': 'int16', 'count': 'int16', 'plot_id': 'int32', 'class_re': 'int16', 'afforestation': 'int8',
+                 'count_afforestation_1km': 'int16'}
+
+# pixel centres keep 64 bit floats, float32 would move them by up to a metre
+wide_columns = ['x_coords', 'y_coords']
+
+# columns of a plot that stay the same over its years when the plot table is written on its own
+plot_columns = ['x', 'y', 'x_coords', 'y_coords']
+
+
+# functions ############################################################################################################
+# write a (Geo)DataFrame as a parquet dataset with one folder per year (year=2003/part-0.parquet, hive layout), so
+# readers can load single years and columns without parsing the rest, typed columns and the crs are kept
+# the dataset is written next to the old one and swapped in once complete
+def write_dataset(df, path, partition='year'):
+    path = pathlib.Path(path)
+    path_tmp = path.with_name(f'{path.name}.tmp')
+    if path_tmp.exists():
+        shutil.rmtree(path_tmp)
+
+    for value, part in df.groupby(partition, sort=True):
+        path_part = path_tmp / f'{partition}={value}'
+        path_part.mkdir(parents=True)
+        part.drop(columns=partition).to_parquet(path_part / 'part-0.parquet', index=False)
+
+    if path.exists():
+        shutil.rmtree(path)
+    path_tmp.rename(path)
+    logging.info(f"Wrote {len(df)} rows to {path.name} in {df[partition].nunique()} partitions")
+
+
+# read a dataset written by write_dataset, only the given years and columns are read from disk
+# GeoParquet comes back as a GeoDataFrame in the compact schema (categories of integers are read back as plain
+# integers by the dataset reader and made categories again, of the same classes whichever years are read)
+def read_dataset(path, years=None, columns=None, partition='year', classes=None):
+    filters = None if years is None else [(partition, 'in', [int(year) for year in years])]
+    try:
+        df = gpd.read_parquet(path, columns=columns, filters=filters)
+    except ValueError:
+        # no geometry column in the dataset or among the selected columns
+        df = pd.read_parquet(path, columns=columns, filters=filters)
+
+    return compact_samples(df.reset_index(drop=True), classes)
+
+
+# smallest integer dtype for pixel indices (int16 up to 32767 rows / cols, int32 beyond)
+def index_dtype(values):
+    return np.int16 if len(values) == 0 or int(values.max()) <= np.iinfo(np.int16).max else np.int32
+
+
+# compact dtypes of a sample point table, the columns are replaced in place:
+# int16 / int32 pixel indices, int16 year, class as category, the other integers as small as they fit, float32
+# predictors (pixel centres excepted) and strings as category (dictionary encoded in parquet)
+# classes: categories of the class column, the ESA registry codes by default, so every table (and every read of a
+# dataset, whichever years it holds) has the same categories
+def compact_samples(df, classes=None):
+    for column in ['x', 'y']:
+        if column in df.columns:
+            df[column] = df[column].astype(index_dtype(df[column].values))
+    if 'class' in df.columns:
+        classes = sorted(registry if classes is None else classes)
+        values = pd.unique(np.asarray(df['class'].dropna())).tolist()
+        unknown = sorted(set(values) - set(classes))
+        if unknown:
+            raise ValueError(f"classes {unknown} are not among the categories of the class column")
+        df['class'] = df['class'].astype(pd.CategoricalDtype(classes))
+
+    for column in df.columns:
+        if column in ['x', 'y', 'class']:
+            continue
+        dtype = df[column].dtype
+        if column in sample_dtypes and df[column].notna().all():
+            df[column] = df[column].astype(sample_dtypes[column])
+        elif dtype == np.float64 and column not in wide_columns:
+            df[column] = df[column].astype(np.float32)
+        elif dtype == object or pd.api.types.is_string_dtype(dtype):
+            df[column] = df[column].astype('category')
+    return df
+
+
+# split a sample point table into a plot table with the geometry and the columns constant over the years of a plot,
+# stored once per plot, and a table of the attributes of every plot and year
+def split_plots(df, key='plot_id', columns=None):
+    if columns is None:
+        columns = plot_columns
+    plots = df.drop_duplicates(key)[[key, *columns, df.geometry.name]].reset_index(drop=True)
+    years = pd.DataFrame(df.drop(columns=[*columns, df.geometry.name]))
+    return plots, years
+
+
+# sample point table from a plot table and the attributes per plot and year, the inverse of split_plots
+def join_plots(plots, years, key='plot_id'):
+    df = years.merge(pd.DataFrame(plots), on=key, how='left', sort=False)
+    return gpd.GeoDataFrame(df, geometry=plots.geometry.name, crs=plots.crs)
+
+
+# write a sample point table as plots.parquet and a year partitioned dataset of the per year attributes (years/)
+def write_plot_tables(df, path, key='plot_id', columns=None):
+    path = pathlib.Path(path)
+    plots, years = split_plots(df, key=key, columns=columns)
+    path.mkdir(parents=True, exist_ok=True)
+    plots.to_parquet(path / 'plots.parquet', index=False)
+    write_dataset(years, path / 'years')
+    logging.info(f"Wrote {len(plots)} plots of {len(years)} plot years to {path.name}")
+
+
+# sample point table written by write_plot_tables, only the given years are read
+def read_plot_tables(path, years=None, key='plot_id'):
+    path = pathlib.Path(path)
+    return join_plots(gpd.read_parquet(path / 'plots.parquet'), read_dataset(path / 'years', years=years), key=key)
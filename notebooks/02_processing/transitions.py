@@ -0,0 +1,130 @@
+# !/usr/bin/env python3
+
+# libraries ############################################################################################################
+import logging
+import numpy as np
+import pandas as pd
+import blocks
+import instrument
+from cube import cube_years
+from landcover import registry
+
+
+# functions ############################################################################################################
+# position of every class code in the transition matrices, -1 for codes that are not classes
+def class_lookup(classes):
+    lookup = np.full(max(classes) + 1, -1, dtype=np.int64)
+    lookup[classes] = np.arange(len(classes))
+    return lookup
+
+
+# rows of a cube strip, whole chunk rows as high as the memory budget allows (the land cover of every year plus
+# the int64 values, transition codes and their sorted copy of every pair per pixel)
+def strip_rows(cube, memory_budget=blocks.memory_budget):
+    chunk_height = cube.chunks[1]
+    bytes_per_row = cube.shape[2] * cube.shape[0] * (cube.dtype.itemsize + 32)
+    return max(chunk_height, (memory_budget // bytes_per_row) // chunk_height * chunk_height)
+
+
+# counts of sorted unique codes added to the counts of more codes: (codes, counts) of both together
+def add_counts(codes, counts, more_codes, more_counts):
+    codes, inverse = np.unique(np.concatenate([codes, more_codes]), return_inverse=True)
+    summed = np.zeros(len(codes), dtype=np.int64)
+    np.add.at(summed, inverse, np.concatenate([counts, more_counts]))
+    return codes, summed
+
+
+# from -> to transition counts of every zone and pair of consecutive cube years in one pass over the cube: every
+# pixel pair is encoded as one (pair, zone, from, to) code and the codes of a strip are counted at once
+# only the transitions that occur are kept, so memory follows the size of the table and not pairs x zones x classes²
+# labels: zone labels on the cube grid (zonal.load_zone_labels), label i is zone i - 1, 0 is outside
+# returns (pair, zone, from, to, count) arrays of the transitions that occur, pair i is cube year i to i + 1
+def cube_transitions(cube, labels, n_zones, classes=None, memory_budget=blocks.memory_budget):
+    n_years, height, width = cube.shape
+    if labels.shape != (height, width):
+        raise ValueError(f"zone labels {labels.shape} do not match the cube grid {(height, width)}")
+
+    classes = sorted(classes or registry)
+    lookup = class_lookup(classes)
+    n_classes = len(classes)
+    n_pairs = n_years - 1
+    pair_offsets = np.arange(n_pairs, dtype=np.int64)[:, np.newaxis] * n_zones * n_classes * n_classes
+    codes_seen = np.zeros(0, dtype=np.int64)
+    counts_seen = np.zeros(0, dtype=np.int64)
+
+    rows = strip_rows(cube, memory_budget)
+    for row_off in range(0, height, rows):
+        strip_labels = labels[row_off:row_off + rows]
+        inside = strip_labels > 0
+        if not inside.any():
+            continue
+        strip = cube[:, row_off:row_off + rows, :]
+        instrument.count(bytes_read=strip.nbytes)
+
+        values = strip[:, inside].astype(np.int64)
+        unknown = (values < 0) | (values >= len(lookup))
+        unknown[~unknown] = lookup[values[~unknown]] < 0
+        if unknown.any():
+            raise ValueError(f"land cover values {sorted(set(values[unknown].tolist()))} are not transition classes")
+
+        index = lookup[values]
+        zone = strip_labels[inside].astype(np.int64) - 1
+        codes = ((zone * n_classes + index[:-1]) * n_classes + index[1:]) + pair_offsets
+        del values, index
+        codes_seen, counts_seen = add_counts(codes_seen, counts_seen, *np.unique(codes, return_counts=True))
+
+    logging.info(f"Done counting transitions of {n_zones} zones for {n_pairs} pairs of years")
+    pair, zone, from_index, to_index = np.unravel_index(codes_seen, (n_pairs, n_zones, n_classes, n_classes))
+    classes = np.array(classes)
+    return pair, zone, classes[from_index], classes[to_index], counts_seen
+
+
+# long table of the transitions of every zone that occur: zone (position in zones), the zone attributes, year (the
+# old year, as the change rasters are keyed), year_new, from, to and count
+# transitions: (pair, zone, from, to, count) arrays of cube_transitions
+def transitions_table(zones, years, transitions):
+    pair, zone, from_classes, to_classes, counts = transitions
+
+    props = pd.DataFrame(zones.drop(columns=zones.geometry.name)).reset_index(drop=True)
+    df = pd.concat([pd.DataFrame({'zone': zone}), props.iloc[zone].reset_index(drop=True)], axis=1)
+    df['year'] = np.array(years[:-1])[pair]
+    df['year_new'] = np.array(years[1:])[pair]
+    df['from'] = from_classes
+    df['to'] = to_classes
+    df['count'] = counts
+    return df
+
+
+# transitions of the zones and pairs of years of a land cover cube
+def zonal_transitions(cube, zones, labels, classes=None, memory_budget=blocks.memory_budget):
+    transitions = cube_transitions(cube, labels, len(zones), classes, memory_budget)
+    instrument.count(features=len(zones))
+    return transitions_table(zones, cube_years(cube), transitions)
+
+
+# counts of selected transitions in the wide layout of zonal.zonal_stats_years: the zone attributes, one column per
+# from class (by='from') or to class (by='to') and the year, for every zone and year (0 where none occurred)
+# groups: {code: code} summarized first (e.g. {11: 10} as change.reclassify), same: keep transitions to the same class
+# e.g. re- and afforestation by source class: transition_events(df, zones, to_classes=[50])
+def transition_events(df, zones, from_classes=None, to_classes=None, by='from', groups=None, same=False):
+    df = df[['zone', 'year', 'from', 'to', 'count']]
+    if groups:
+        df = df.assign(**{'from': df['from'].replace(groups), 'to': df['to'].replace(groups)})
+    selected = np.ones(len(df), dtype=bool) if same else (df['from'] != df['to']).to_numpy(copy=True)
+    if from_classes is not None:
+        selected &= df['from'].isin(from_classes).to_numpy()
+    if to_classes is not None:
+        selected &= df['to'].isin(to_classes).to_numpy()
+
+    years = np.sort(df['year'].unique())
+    index = pd.MultiIndex.from_product([np.arange(len(zones)), years], names=['zone', 'year'])
+    wide = (df[selected].groupby(['zone', 'year', by])['count'].sum()
+            .unstack(by, fill_value=0)
+            .reindex(index, fill_value=0))
+    wide.columns = wide.columns.tolist()
+
+    props = pd.DataFrame(zones.drop(columns=zones.geometry.name)).reset_index(drop=True)
+    wide = wide.reset_index()
+    df = pd.concat([props.iloc[wide['zone']].reset_index(drop=True), wide.drop(columns=['zone', 'year'])], axis=1)
+    df['year'] = wide['year'].to_numpy()
+    return df
@@ -0,0 +1,22 @@
+# !/usr/bin/env python3
+
+# libraries ############################################################################################################
+import argparse
+
+
+# functions ############################################################################################################
+# the year ingested incrementally (--new-year), None runs every year
+def parse_new_year():
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--new-year', type=int, default=None)
+    args, _ = parser.parse_known_args()
+    return args.new_year
+
+
+# the rasters a stage needs: every year, or only the new year and the years before it that its transitions use
+def incremental_years(rasters, new_year, n_before=0):
+    if new_year is None:
+        return rasters
+    if new_year not in rasters:
+        raise ValueError(f"no raster for the new year {new_year}")
+    return {year: path for year, path in rasters.items() if new_year - n_before <= year <= new_year}
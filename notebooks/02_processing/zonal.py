@@ -0,0 +1,148 @@
+# !/usr/bin/env python3
+
+# libraries ############################################################################################################
+import logging
+import pathlib
+import hashlib
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import rasterio
+import rasterio.features
+import instrument
+from parallel import run_parallel
+
+# global variables #####################################################################################################
+# zone layers of a worker process, set once per worker instead of being sent with every year
+worker_zone_layers = {}
+
+
+# functions ############################################################################################################
+# short id of a raster grid (crs, transform, shape) so label rasters are cached per grid
+def grid_id(src):
+    grid = f"{src.crs.to_wkt() if src.crs else ''}|{tuple(src.transform)}|{src.width}|{src.height}"
+    return hashlib.md5(grid.encode()).hexdigest()[:10]
+
+
+# rasterize zone polygons onto the grid of a template raster, label i belongs to zones.iloc[i - 1], 0 is outside
+# zones must not overlap, where they do the later feature wins
+def rasterize_zones(zones, src):
+    if src.crs is not None and zones.crs is not None and zones.crs != src.crs:
+        zones = zones.to_crs(src.crs)
+    dtype = 'uint16' if len(zones) < np.iinfo(np.uint16).max else 'uint32'
+    shapes = ((geom, i) for i, geom in enumerate(zones.geometry, start=1) if geom is not None and not geom.is_empty)
+    return rasterio.features.rasterize(shapes,
+                                       out_shape=(src.height, src.width),
+                                       transform=src.transform,
+                                       fill=0,
+                                       dtype=dtype)
+
+
+# read a zone layer and its label raster on the template grid, the label raster is rasterized once and cached
+def load_zone_labels(path_zones, template, path_cache):
+    path_zones = pathlib.Path(path_zones)
+    path_cache = pathlib.Path(path_cache)
+    zones = gpd.read_file(path_zones)
+
+    with rasterio.open(template) as src:
+        path_labels = path_cache / f'{path_zones.stem}_{grid_id(src)}_labels.tiff'
+
+        if path_labels.exists() and path_labels.stat().st_mtime >= path_zones.stat().st_mtime:
+            with rasterio.open(path_labels) as cached:
+                labels = cached.read(1)
+            logging.info(f"Loaded cached zone labels {path_labels.name}")
+            return zones, labels
+
+        labels = rasterize_zones(zones, src)
+        meta = src.meta.copy()
+
+    meta.update({'driver': 'GTiff',
+                 'count': 1,
+                 'dtype': labels.dtype.name,
+                 'nodata': None,
+                 'compress': 'DEFLATE',
+                 'tiled': True})
+    path_cache.mkdir(parents=True, exist_ok=True)
+    with rasterio.open(path_labels, 'w', **meta) as dst:
+        dst.write(labels, 1)
+    logging.info(f"Rasterized {len(zones)} zones to {path_labels.name}")
+
+    return zones, labels
+
+
+# count the pixels of every class per zone with a single bincount over (zone, class) codes
+def zonal_counts(labels, data, n_zones, nodata=None):
+    inside = labels > 0
+    if nodata is not None:
+        inside &= data != nodata
+
+    zone = labels[inside].astype(np.int64) - 1
+    values = data[inside].astype(np.int64)
+    if values.size == 0:
+        return np.array([], dtype=np.int64), np.zeros((n_zones, 0), dtype=np.int64)
+
+    offset = values.min()
+    values -= offset
+    n_values = int(values.max()) + 1
+
+    counts = np.bincount(zone * n_values + values, minlength=n_zones * n_values).reshape(n_zones, n_values)
+    classes = np.arange(n_values) + offset
+
+    # only keep classes that actually occur
+    keep = counts.any(axis=0)
+    return classes[keep], counts[:, keep]
+
+
+# pool initializer that hands the zone layers to a worker process
+def set_zone_layers(zone_layers):
+    global worker_zone_layers
+    worker_zone_layers = zone_layers
+
+
+# class counts of one year for every zone layer: (year, path) -> {name: (classes, counts)}
+def year_counts(task):
+    year, path = task
+    with instrument.stage('zonal_counts', year=year):
+        with rasterio.open(path) as src:
+            data = src.read(1)
+            nodata = src.nodata
+        instrument.count(bytes_read=data.nbytes)
+
+        counts = {}
+        for name, (zones, labels) in worker_zone_layers.items():
+            if labels.shape != data.shape:
+                raise ValueError(f"zone labels of {name} do not match the grid of {path}")
+            counts[name] = zonal_counts(labels, data, len(zones), nodata)
+            instrument.count(features=len(zones))
+
+    logging.info(f"Done calculating zonal counts for {str(year)}")
+    return counts
+
+
+# long table with the zone attributes, one column per class (sorted, missing classes are 0) and the year, same
+# layout as the rasterstats categorical output, filled into one preallocated count matrix
+def counts_table(zones, years, year_counts):
+    classes = sorted(set().union(*[c.tolist() for c, _ in year_counts]))
+    position = {c: i for i, c in enumerate(classes)}
+    n_zones = len(zones)
+
+    counts = np.zeros((len(years) * n_zones, len(classes)), dtype=np.int64)
+    for i, (year_classes, year_count) in enumerate(year_counts):
+        counts[i * n_zones:(i + 1) * n_zones, [position[c] for c in year_classes.tolist()]] = year_count
+
+    props = pd.DataFrame(zones.drop(columns=zones.geometry.name)).reset_index(drop=True)
+    df = pd.concat([props.iloc[np.tile(np.arange(n_zones), len(years))].reset_index(drop=True),
+                    pd.DataFrame(counts, columns=classes)], axis=1)
+    df['year'] = np.repeat(list(years), n_zones)
+    return df
+
+
+# categorical zonal stats for every year and zone layer, each land cover raster is read once for all zone layers and
+# the years run on a process pool
+# rasters: {year: path}, zone_layers: {name: (zones, labels)}
+def zonal_stats_years(rasters, zone_layers, workers=1):
+    results = run_parallel(year_counts, rasters.items(), workers=workers,
+                           initializer=set_zone_layers, initargs=(zone_layers,))
+
+    return {name: counts_table(zones, list(rasters), [counts[name] for counts in results])
+            for name, (zones, _) in zone_layers.items()}